@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# Benchmarks decoding a sensor_msgs/CompressedImage JPEG for display: the full decode and
+# resize that CompressedImageViewer used to do against the reduced-scale (draft) decode it
+# does now, at common camera resolutions and the terminal sizes of bench_viewers.py.
+# Also reports how far the two results are apart, in mean absolute difference per channel.
+#
+# Usage: PYTHONPATH=. python3 benchmarks/bench_jpeg.py
+
+import io
+import time
+import numpy as np
+import PIL.Image
+
+from bench_viewers import make_rgb, TERMINAL_SIZES
+from rosshow.viewers.generic.GenericImageViewer import fit_image
+from rosshow.viewers.sensor_msgs.CompressedImageViewer import decode_compressed_image
+
+RESOLUTIONS = ((640, 480), (1280, 720), (1920, 1080), (3840, 2160))
+
+def decode_full(data, w, h):
+    image_obj = PIL.Image.open(io.BytesIO(data))
+    if image_obj.mode != "RGB":
+        image_obj = image_obj.convert("RGB")
+    return fit_image(image_obj, w, h)
+
+def best_time(f, repeat = 7):
+    times = []
+    for _ in range(repeat):
+        t = time.time()
+        result = f()
+        times.append(time.time() - t)
+    return min(times), result
+
+def main():
+    rng = np.random.default_rng(0)
+    print("%-10s %-8s %10s %10s %8s %6s" % ("image", "terminal", "full ms", "draft ms", "speedup", "diff"))
+    for width, height in RESOLUTIONS:
+        output = io.BytesIO()
+        PIL.Image.fromarray(make_rgb(width, height, rng)).save(output, format = "JPEG", quality = 90)
+        data = output.getvalue()
+        for cols, rows in TERMINAL_SIZES:
+            # the canvas is 2 x 4 dots per character
+            w, h = cols * 2, rows * 4
+            full_time, full = best_time(lambda: decode_full(data, w, h))
+            draft_time, draft = best_time(lambda: decode_compressed_image(None, data, w, h))
+            diff = np.abs(full.astype(np.int16) - draft.astype(np.int16)).mean()
+            print("%-10s %-8s %10.2f %10.2f %7.1fx %6.2f" % ("%dx%d" % (width, height), "%dx%d" % (cols, rows),
+                full_time * 1000, draft_time * 1000, full_time / draft_time, diff))
+
+if __name__ == "__main__":
+    main()
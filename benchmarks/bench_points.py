@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# Benchmarks TermGraphics.points() against the previous np.bitwise_or.at implementation
+# and checks that both produce exactly the same buffer and colors.
+#
+# Usage: PYTHONPATH=. python3 benchmarks/bench_points.py
+
+import time
+import numpy as np
+
+import rosshow.termgraphics as termgraphics
+
+def points_reference(g, points, colors = None, clear_block = False):
+    """
+    The unbuffered ufunc.at version of TermGraphics.points() that the current one replaced.
+    """
+    i_array = points[:, 0] >> 1
+    j_array = points[:, 1] >> 2
+    where_valid = (i_array >= 0) & (j_array >= 0) & \
+        (i_array < g.term_shape[0]) & (j_array < g.term_shape[1])
+    i_array = i_array[where_valid]
+    j_array = j_array[where_valid]
+    points = points[where_valid, :]
+    if colors is not None:
+        colors = colors[where_valid, :]
+    if clear_block:
+        g.buffer[j_array, i_array] = 0x2800
+    np.bitwise_or.at(g.buffer, (j_array, i_array),
+        termgraphics.UNICODE_BRAILLE_MAP[(points[:, 0] & 0b1) | ((points[:, 1] & 0b11) << 1)])
+    np.bitwise_and.at(g.buffer, (j_array, i_array), 0x00FF)
+    np.bitwise_or.at(g.buffer, (j_array, i_array), 0x2800)
+    if colors is not None:
+        g.colors[j_array, i_array, :] = colors
+    else:
+        g.colors[j_array, i_array, :] = g.current_color
+
+def best_time(f, repeat = 5):
+    times = []
+    for _ in range(repeat):
+        t = time.time()
+        f()
+        times.append(time.time() - t)
+    return min(times)
+
+def main():
+    g = termgraphics.TermGraphics(size = (250, 70))
+    w, h = g.shape
+    rng = np.random.default_rng(0)
+
+    print("terminal: %d x %d cells" % g.term_shape)
+    print("%10s %8s %14s %14s %8s" % ("points", "colors", "reference ms", "points() ms", "speedup"))
+
+    for n in (10000, 100000, 1000000):
+        for with_colors in (False, True):
+            points = np.vstack((rng.integers(-w // 10, w + w // 10, n), rng.integers(-h // 10, h + h // 10, n))).T.astype(np.int16)
+            colors = rng.integers(0, 256, (n, 3)).astype(np.uint8) if with_colors else None
+
+            g.clear()
+            points_reference(g, points, colors)
+            expected = (g.buffer.copy(), g.colors.copy())
+            g.clear()
+            g.points(points, colors)
+            assert (g.buffer == expected[0]).all() and (g.colors == expected[1]).all(), "output mismatch"
+
+            t_reference = best_time(lambda: points_reference(g, points, colors))
+            t_points = best_time(lambda: g.points(points, colors))
+            print("%10d %8s %14.2f %14.2f %7.1fx" % (n, with_colors, t_reference * 1e3, t_points * 1e3, t_reference / t_points))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+# End-to-end benchmark of the viewers in VIEWER_MAPPING. Feeds synthetic messages into each
+# viewer, draws on a headless TermGraphics canvas at several terminal sizes and reports the
+# time and bytes per frame and the peak memory allocated while drawing.
+#
+# Runs without ROS: messages are stand-in objects with the same fields as the real ones.
+#
+# Usage: PYTHONPATH=. python3 benchmarks/bench_viewers.py [substring of message type or case]
+#        e.g. PYTHONPATH=. python3 benchmarks/bench_viewers.py PointCloud2
+
+import array
+import io
+import sys
+import threading
+import time
+import tracemalloc
+import numpy as np
+
+import rosshow.termgraphics as termgraphics
+from rosshow.viewers import VIEWER_MAPPING
+
+TERMINAL_SIZES = ((80, 24), (160, 48), (320, 96))
+
+# frames drawn per case: at least MIN_FRAMES, then until MAX_SECONDS have passed
+MIN_FRAMES = 3
+MAX_FRAMES = 30
+MAX_SECONDS = 2.0
+
+class Message(object):
+    """
+    Stand-in for a ROS message: a bag of attributes.
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class PointField(Message):
+    INT8 = 1
+    UINT8 = 2
+    INT16 = 3
+    UINT16 = 4
+    INT32 = 5
+    UINT32 = 6
+    FLOAT32 = 7
+    FLOAT64 = 8
+
+class PointCloud2(Message):
+    pass
+
+def vector3(x, y, z):
+    return Message(x = x, y = y, z = z)
+
+def quaternion_from_yaw(yaw):
+    return Message(x = 0., y = 0., z = np.sin(yaw / 2), w = np.cos(yaw / 2))
+
+def make_point_cloud(n, rng):
+    xyz = rng.normal(0, 5, (n, 3)).astype(np.float32)
+    rgb = rng.integers(0, 2 ** 24, n).astype(np.float32).reshape(-1, 1)
+    data = np.hstack((xyz, rgb))
+    return PointCloud2(
+        height = 1,
+        width = n,
+        fields = [PointField(name = name, offset = 4 * k, datatype = PointField.FLOAT32, count = 1)
+            for k, name in enumerate(("x", "y", "z", "rgb"))],
+        is_bigendian = False,
+        point_step = 16,
+        row_step = 16 * n,
+        data = data.tobytes(),
+        is_dense = True,
+    )
+
+def make_rgb(width, height, rng):
+    """
+    A smooth gradient with sensor noise, so that frames differ a bit like a real camera's.
+    """
+    x = np.linspace(0, 255, width, dtype = np.float32)
+    y = np.linspace(0, 255, height, dtype = np.float32)
+    image = np.empty((height, width, 3), dtype = np.float32)
+    image[:, :, 0] = x[None, :]
+    image[:, :, 1] = y[:, None]
+    image[:, :, 2] = 128
+    image += rng.normal(0, 4, (height, width, 1))
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def make_image(width, height, rng):
+    image = make_rgb(width, height, rng)
+    return Message(height = height, width = width, encoding = "rgb8", is_bigendian = 0,
+        step = width * 3, data = image.tobytes())
+
+def make_depth_image(width, height, rng):
+    """
+    A tilted floor in millimeters with sensor noise and holes (zeros), like a depth camera's.
+    """
+    depth = np.linspace(500, 8000, height, dtype = np.float32)[:, None] + rng.normal(0, 20, (height, width))
+    depth[rng.random((height, width)) < 0.05] = 0
+    return Message(height = height, width = width, encoding = "16UC1", is_bigendian = 0,
+        step = width * 2, data = np.clip(depth, 0, 65535).astype(np.uint16).tobytes())
+
+def make_bayer_image(width, height, rng):
+    image = make_rgb(width, height, rng)
+    mosaic = image[:, :, 1].copy()
+    mosaic[0::2, 0::2] = image[0::2, 0::2, 0]
+    mosaic[1::2, 1::2] = image[1::2, 1::2, 2]
+    return Message(height = height, width = width, encoding = "bayer_rggb8", is_bigendian = 0,
+        step = width, data = mosaic.tobytes())
+
+def make_yuv_image(width, height, rng):
+    """
+    uyvy with the gradient of make_rgb in the chroma and noise in the luma.
+    """
+    macropixels = np.empty((height, width // 2, 4), dtype = np.uint8)
+    macropixels[:, :, 0] = np.linspace(0, 255, width // 2, dtype = np.float32)[None, :]
+    macropixels[:, :, 2] = np.linspace(0, 255, height, dtype = np.float32)[:, None]
+    macropixels[:, :, 1] = macropixels[:, :, 3] = np.clip(rng.normal(128, 4, (height, width // 2)), 0, 255)
+    return Message(height = height, width = width, encoding = "yuv422", is_bigendian = 0,
+        step = width * 2, data = macropixels.tobytes())
+
+def make_float_depth_image(width, height, rng):
+    depth = make_depth_image(width, height, rng)
+    depth = np.frombuffer(depth.data, dtype = np.uint16).reshape(height, width) / np.float32(1000.)
+    depth[depth == 0] = np.nan
+    return Message(height = height, width = width, encoding = "32FC1", is_bigendian = 0,
+        step = width * 4, data = depth.astype(np.float32).tobytes())
+
+def make_compressed_image(width, height, rng):
+    import PIL.Image
+    output = io.BytesIO()
+    PIL.Image.fromarray(make_rgb(width, height, rng)).save(output, format = "JPEG", quality = 90)
+    return Message(format = "jpeg", data = output.getvalue())
+
+def make_occupancy_grid(width, height, rng):
+    grid = np.full((height, width), -1, dtype = np.int8)
+    grid[height // 8:-height // 8, width // 8:-width // 8] = 0
+    walls = rng.random((height, width)) < 0.02
+    grid[walls] = 100
+    return Message(
+        info = Message(width = width, height = height, resolution = 0.05,
+            origin = Message(position = vector3(0., 0., 0.), orientation = quaternion_from_yaw(0.))),
+        data = array.array("b", grid.tobytes()),
+    )
+
+def make_path(n, rng):
+    t = np.linspace(0, 20 * np.pi, n)
+    return Message(poses = [Message(pose = Message(position = vector3(x, y, 0.), orientation = quaternion_from_yaw(0.)))
+        for x, y in zip(t * np.cos(t) / 10, t * np.sin(t) / 10)])
+
+def make_laser_scan(n, rng):
+    return Message(angle_min = -np.pi, angle_max = np.pi, angle_increment = 2 * np.pi / n,
+        range_min = 0.1, range_max = 30., ranges = list(5 + rng.random(n)))
+
+def make_imu(k, rng):
+    return Message(
+        orientation = quaternion_from_yaw(k * 1e-3),
+        angular_velocity = vector3(*rng.normal(0, 1, 3)),
+        linear_acceleration = vector3(*rng.normal((0, 0, 9.8), 0.5)),
+    )
+
+def make_odometry(k, rng):
+    return Message(pose = Message(pose = Message(position = vector3(np.cos(k * 1e-2), np.sin(k * 1e-2), 0.),
+        orientation = quaternion_from_yaw(k * 1e-2))))
+
+def make_fix(k, rng):
+    """
+    A 10 Hz fix driving east at about 20 m/s, so that the map crosses into a new tile every
+    few seconds at zoom level 17 and the prefetched neighbors get used.
+    """
+    return Message(latitude = 37.7749 + rng.normal(0, 1e-6), longitude = -122.4194 + k * 2.3e-5)
+
+_tile_server = None
+
+def tile_server_url():
+    """
+    Starts an HTTP server on localhost, the first time, that serves the same 256 x 256 PNG
+    for every tile, and returns its tile URL template. It stands in for OpenStreetMap, so
+    that the tile loading and prefetching of NavSatFixViewer are measured without network.
+    """
+    global _tile_server
+    if _tile_server is None:
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        import PIL.Image
+
+        output = io.BytesIO()
+        PIL.Image.fromarray(make_rgb(256, 256, np.random.default_rng(0))).save(output, format = "PNG")
+        tile = output.getvalue()
+
+        class TileHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # keep-alive, like the real tile servers
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(tile)))
+                self.end_headers()
+                self.wfile.write(tile)
+            def log_message(self, *args):
+                pass
+
+        _tile_server = ThreadingHTTPServer(("127.0.0.1", 0), TileHandler)
+        thread = threading.Thread(target = _tile_server.serve_forever)
+        thread.daemon = True
+        thread.start()
+    return "http://127.0.0.1:%d/{z}/{x}/{y}.png" % _tile_server.server_address[1]
+
+def make_twist(k, rng):
+    return Message(linear = vector3(*rng.normal(0, 1, 3)), angular = vector3(*rng.normal(0, 1, 3)))
+
+# (message type, case name, messages per frame, function(k, rng) making the k-th message)
+# Big messages are made twice and alternated; streams are made fresh for every update.
+# Zero messages per frame means one latched message that is redrawn every frame.
+def cases():
+    def alternate(make):
+        cache = []
+        def message(k, rng):
+            if len(cache) < 2:
+                cache.append(make(rng))
+            return cache[k % 2]
+        return message
+
+    for n in (10000, 100000, 500000, 2000000):
+        yield ("sensor_msgs/PointCloud2", "%d points" % n, 1, alternate(lambda rng, n = n: make_point_cloud(n, rng)))
+    for width, height in ((640, 480), (1920, 1080), (3840, 2160)):
+        yield ("sensor_msgs/Image", "%dx%d rgb8" % (width, height), 1,
+            alternate(lambda rng, width = width, height = height: make_image(width, height, rng)))
+        yield ("sensor_msgs/CompressedImage", "%dx%d jpeg" % (width, height), 1,
+            alternate(lambda rng, width = width, height = height: make_compressed_image(width, height, rng)))
+    for width, height in ((640, 480), (1280, 720)):
+        yield ("sensor_msgs/Image", "%dx%d 16UC1" % (width, height), 1,
+            alternate(lambda rng, width = width, height = height: make_depth_image(width, height, rng)))
+    yield ("sensor_msgs/Image", "1920x1080 bayer_rggb8", 1, alternate(lambda rng: make_bayer_image(1920, 1080, rng)))
+    yield ("sensor_msgs/Image", "1920x1080 yuv422", 1, alternate(lambda rng: make_yuv_image(1920, 1080, rng)))
+    yield ("sensor_msgs/Image", "1280x720 32FC1", 1, alternate(lambda rng: make_float_depth_image(1280, 720, rng)))
+    for size in (1000, 4000):
+        yield ("nav_msgs/OccupancyGrid", "%dx%d" % (size, size), 1,
+            alternate(lambda rng, size = size: make_occupancy_grid(size, size, rng)))
+    for n in (10000, 100000):
+        yield ("nav_msgs/Path", "%d poses" % n, 1, alternate(lambda rng, n = n: make_path(n, rng)))
+    yield ("sensor_msgs/PointCloud2", "500000 latched", 0, alternate(lambda rng: make_point_cloud(500000, rng)))
+    yield ("sensor_msgs/Image", "1920x1080 latched", 0, alternate(lambda rng: make_image(1920, 1080, rng)))
+    yield ("nav_msgs/OccupancyGrid", "4000x4000 latched", 0, alternate(lambda rng: make_occupancy_grid(4000, 4000, rng)))
+    yield ("sensor_msgs/LaserScan", "1080 ranges", 1, alternate(lambda rng: make_laser_scan(1080, rng)))
+    # streams at 1 kHz, i.e. 67 messages per frame at 15 fps
+    yield ("sensor_msgs/Imu", "1 kHz", 67, make_imu)
+    yield ("nav_msgs/Odometry", "1 kHz", 67, make_odometry)
+    yield ("geometry_msgs/Twist", "1 kHz", 67, make_twist)
+    yield ("std_msgs/Float32", "1 kHz", 67, lambda k, rng: Message(data = rng.normal()))
+    yield ("sensor_msgs/NavSatFix", "10 Hz, local tiles", 1, make_fix)
+
+def load_viewer(topic_type, canvas):
+    module_name, class_name, viewer_kwargs = VIEWER_MAPPING[topic_type]
+    viewer_class = getattr(__import__(module_name, fromlist = (class_name)), class_name)
+    if "tile_url" in viewer_class.__init__.__code__.co_varnames:
+        viewer_kwargs = dict(viewer_kwargs, tile_url = tile_server_url())
+    return viewer_class(canvas, title = topic_type, **viewer_kwargs)
+
+def wait_for_tiles(viewer, timeout = 5.):
+    """
+    Waits for the tiles that the first frame asked for, so that the frames measured draw
+    the map rather than the loading message.
+    """
+    if "tile_loader" not in dir(viewer):
+        return
+    deadline = time.time() + timeout
+    while viewer.tile_loader.pending and time.time() < deadline:
+        time.sleep(0.01)
+
+def run_frames(viewer, make_message, messages_per_frame, rng, k, frames):
+    for _ in range(frames):
+        for _ in range(messages_per_frame):
+            viewer.update(make_message(k, rng))
+            k += 1
+        viewer.draw()
+    return k
+
+def bench(topic_type, make_message, messages_per_frame, size):
+    rng = np.random.default_rng(0)
+    canvas = termgraphics.TermGraphics(size = size, color_support = termgraphics.COLOR_SUPPORT_24BIT)
+    viewer = load_viewer(topic_type, canvas)
+    if messages_per_frame == 0:
+        viewer.update(make_message(0, rng))
+
+    # warm up: first frame is a full redraw and lazily built tables
+    k = run_frames(viewer, make_message, messages_per_frame, rng, 0, 1)
+    wait_for_tiles(viewer)
+
+    bytes_written = canvas.sink.bytes_written
+    frames = 0
+    start_time = time.time()
+    while frames < MAX_FRAMES and (frames < MIN_FRAMES or time.time() - start_time < MAX_SECONDS):
+        k = run_frames(viewer, make_message, messages_per_frame, rng, k, 1)
+        frames += 1
+    frame_time = (time.time() - start_time) / frames
+    frame_bytes = (canvas.sink.bytes_written - bytes_written) / frames
+
+    # separately, since tracing slows down allocation-heavy code
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    run_frames(viewer, make_message, messages_per_frame, rng, k, 2)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    if "close" in dir(viewer):
+        viewer.close()
+
+    return frame_time, frame_bytes, peak
+
+def main():
+    pattern = sys.argv[1] if len(sys.argv) > 1 else ""
+    print("%-28s %-21s %9s %10s %12s %10s" % ("message type", "case", "terminal", "ms/frame", "bytes/frame", "peak MB"))
+    for topic_type, case, messages_per_frame, make_message in cases():
+        if pattern not in topic_type and pattern not in case:
+            continue
+        for size in TERMINAL_SIZES:
+            try:
+                frame_time, frame_bytes, peak = bench(topic_type, make_message, messages_per_frame, size)
+            except Exception as e:
+                print("%-28s %-21s %9s failed: %s" % (topic_type, case, "%dx%d" % size, repr(e)))
+                continue
+            print("%-28s %-21s %9s %10.1f %12d %10.1f" % (topic_type, case, "%dx%d" % size,
+                frame_time * 1e3, frame_bytes, peak / 1e6))
+            sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import time
+import rosshow.termgraphics as termgraphics
+
+COLOR_SUPPORT_NAMES = {
+    termgraphics.COLOR_SUPPORT_1: "mono",
+    termgraphics.COLOR_SUPPORT_16: "16c",
+    termgraphics.COLOR_SUPPORT_256: "256c",
+    termgraphics.COLOR_SUPPORT_24BIT: "24bit",
+}
+
+class BandwidthGovernor(object):
+    """
+    Keeps the output of a TermGraphics canvas within max_kbps kilobits per second, e.g. for
+    a slow SSH connection, so that output doesn't back up and keypresses stay responsive.
+
+    After every frame, update() is told how many bytes were written and how long the writes
+    blocked. Blocked writes mean the link is slower than max_kbps, in which case the measured
+    throughput is used as the budget instead. The frame rate is picked so that the average
+    frame fits the budget. If that would go below twice min_frame_rate, the canvas gives up
+    detail one level at a time: first a higher lossy color threshold, then fewer colors. It
+    gets it back once there is plenty of room again.
+
+    A level is kept for at least hold_frames frames and hold_time seconds. Each time the
+    governor turns around (e.g. gives detail back right after taking it away), the time it
+    has to hold the next level doubles, up to max_hold_time, so that a load that keeps
+    changing doesn't make it switch back and forth. The detail level, level changes and
+    the current hold time are counted in the canvas's profiler, i.e. shown in the HUD and
+    written to the trace.
+    """
+    def __init__(self, canvas, max_kbps, max_frame_rate = 15., min_frame_rate = 2., hold_frames = 30,
+            hold_time = 2., max_hold_time = 30.):
+        self.canvas = canvas
+        self.max_bytes_per_second = max_kbps * 1000. / 8.
+        self.max_frame_rate = max_frame_rate
+        self.min_frame_rate = min_frame_rate
+        self.hold_frames = hold_frames
+        self.min_hold_time = hold_time
+        self.max_hold_time = max_hold_time
+        self.hold_time = hold_time
+        self.frame_rate = max_frame_rate
+
+        self.frame_bytes = None # moving average of bytes per frame
+        self.link_bytes_per_second = None # measured while writes block
+        self.last_bytes_written = canvas.sink.bytes_written
+        self.last_write_time = canvas.sink.write_time
+
+        # detail levels, from what the user asked for down to the cheapest
+        color_support = canvas.color_support
+        color_threshold = canvas.color_threshold
+        self.levels = [(color_support, color_threshold)]
+        if color_support == termgraphics.COLOR_SUPPORT_24BIT:
+            self.levels.append((color_support, max(color_threshold, 16)))
+            self.levels.append((color_support, max(color_threshold, 48)))
+        for lower_color_support in (termgraphics.COLOR_SUPPORT_256, termgraphics.COLOR_SUPPORT_16):
+            if color_support > lower_color_support:
+                self.levels.append((lower_color_support, color_threshold))
+        self.level = 0
+        self.frames_at_level = 0
+        self.level_time = time.time() # when the current level was set
+        self.last_step = 0 # +1 if the last change took detail away, -1 if it gave some back
+
+    @property
+    def frame_duration(self):
+        return 1. / self.frame_rate
+
+    def update(self):
+        """
+        Accounts for the frame that was just drawn and adapts frame rate and detail. Returns
+        the duration of the next frame in seconds.
+        """
+        sink = self.canvas.sink
+        frame_bytes = sink.bytes_written - self.last_bytes_written
+        write_time = sink.write_time - self.last_write_time
+        self.last_bytes_written = sink.bytes_written
+        self.last_write_time = sink.write_time
+
+        if self.frame_bytes is None:
+            self.frame_bytes = float(frame_bytes)
+        else:
+            self.frame_bytes += 0.25 * (frame_bytes - self.frame_bytes)
+
+        if write_time > 0.1 * self.frame_duration and frame_bytes > 0:
+            link_bytes_per_second = frame_bytes / write_time
+            if self.link_bytes_per_second is None:
+                self.link_bytes_per_second = link_bytes_per_second
+            else:
+                self.link_bytes_per_second += 0.25 * (link_bytes_per_second - self.link_bytes_per_second)
+        elif self.link_bytes_per_second is not None:
+            # probe for the link getting faster again
+            self.link_bytes_per_second *= 1.02
+            if self.link_bytes_per_second >= self.max_bytes_per_second:
+                self.link_bytes_per_second = None
+
+        bytes_per_second = self.max_bytes_per_second
+        if self.link_bytes_per_second is not None:
+            bytes_per_second = min(bytes_per_second, self.link_bytes_per_second)
+
+        frame_rate = bytes_per_second / max(self.frame_bytes, 1.)
+        self.frame_rate = min(self.max_frame_rate, max(self.min_frame_rate, frame_rate))
+
+        self.frames_at_level += 1
+        time_at_level = time.time() - self.level_time
+        if time_at_level > 4 * self.hold_time:
+            # settled: stop backing off
+            self.hold_time = self.min_hold_time
+        if self.frames_at_level >= self.hold_frames and time_at_level >= self.hold_time:
+            if frame_rate < 2 * self.min_frame_rate and self.level < len(self.levels) - 1:
+                self.step(1)
+            elif frame_rate > 2 * self.max_frame_rate and self.level > 0:
+                self.step(-1)
+
+        profiler = self.canvas.profiler
+        profiler.count("detail_level", self.level)
+        profiler.count("detail_hold_ms", int(self.hold_time * 1000))
+
+        return self.frame_duration
+
+    def step(self, direction):
+        """
+        Takes detail away (direction 1) or gives some back (direction -1), backing off from
+        further changes if this reverses the previous one.
+        """
+        if direction == -self.last_step:
+            self.hold_time = min(2 * self.hold_time, self.max_hold_time)
+        self.last_step = direction
+        self.set_level(self.level + direction)
+        self.canvas.profiler.count("detail_changes")
+
+    def set_level(self, level):
+        self.level = level
+        self.frames_at_level = 0
+        self.level_time = time.time()
+        color_support, color_threshold = self.levels[level]
+        self.canvas.color_threshold = color_threshold
+        self.canvas.set_color_support(color_support)
+
+    def status(self):
+        """
+        Returns a short description of the current frame rate, detail and data rate.
+        """
+        color_support, color_threshold = self.levels[self.level]
+        detail = COLOR_SUPPORT_NAMES[color_support]
+        if color_support == termgraphics.COLOR_SUPPORT_24BIT and color_threshold:
+            detail += "~%d" % color_threshold
+        return "%.1ffps %s %dkbps" % (self.frame_rate, detail, self.frame_bytes * self.frame_rate * 8 / 1000)
@@ -15,18 +15,29 @@ class AnglePlotter(object):
 
     def plot(self):
         width, height = self.g.shape
-        self.g.rect(
+        segments = self.g.rect_segments(
           (int(self.left), int(self.top)),
           (int(self.right), int(self.bottom)),
         )
-        self.g.line(
+        segments.append(
           (int(1 + self.left + (self.right - self.left)/2.0 - (self.right - self.left)/2.0*math.cos(self.angle)),
-          int(1 + self.top + (self.bottom - self.top)/2.0 + (self.bottom - self.top)/2.0*math.sin(self.angle))),
-          (int(1 + self.left + (self.right - self.left)/2.0 + (self.right - self.left)/2.0*math.cos(self.angle)),
+          int(1 + self.top + (self.bottom - self.top)/2.0 + (self.bottom - self.top)/2.0*math.sin(self.angle)),
+          int(1 + self.left + (self.right - self.left)/2.0 + (self.right - self.left)/2.0*math.cos(self.angle)),
           int(1 + self.top + (self.bottom - self.top)/2.0 - (self.bottom - self.top)/2.0*math.sin(self.angle))),
         )
+        self.g.lines(segments)
 
 class ScopePlotter(object):
+    """
+    Oscilloscope-style plot of the last n values, which are kept in a ring buffer and swept
+    from left to right.
+
+    The history is split into as many bins as the plot is wide in dots (or one bin per value
+    if there are fewer values than that) and the min/max of each bin is kept up to date as
+    values come in. When there is more than one value per bin the plot is drawn as a min/max
+    envelope, so drawing costs the same for any length of history. Autoscaling uses the bin
+    extrema as well.
+    """
     def __init__(self, g, left = 0, right = 1, top = 0, bottom = 1, ymin = None, ymax = None, n = 128, title = None):
         self.g = g
         self.left = left
@@ -35,11 +46,20 @@ class ScopePlotter(object):
         self.bottom = bottom
         self.ymax = ymax
         self.ymin = ymin
-        self.data = np.array([ np.nan ] * n, dtype = np.float32)
+        self.data = np.full(n, np.nan, dtype = np.float32)
         self.data[0] = 0.0
         self.pointer = 0
         self.title = title
 
+        # number of values ever written, and as of the last plot()
+        self.count = 0
+        self.plotted_count = 0
+
+        # bins of the history; bin k spans self.data[bin_starts[k]:bin_starts[k + 1]]
+        self.bin_starts = None
+        self.bin_min = None
+        self.bin_max = None
+
     def get_nice_scale_bound(self, value):
         if value < 1e-6:
             return 1.0
@@ -55,32 +75,99 @@ class ScopePlotter(object):
     def update(self, value):
         self.data[self.pointer] = value
         self.pointer = (self.pointer + 1) % len(self.data)
+        self.count += 1
+
+    def update_many(self, values):
+        """
+        Same as calling update() with each of values in turn.
+        """
+        n = len(self.data)
+        values = np.asarray(values, dtype = np.float32)
+        total = values.shape[0]
+        # only the last n values survive, at the positions update() would have put them
+        values = values[-n:]
+        k = values.shape[0]
+        self.data[(self.pointer + total - k + np.arange(k)) % n] = values
+        self.pointer = (self.pointer + total) % n
+        self.count += total
+
+    def update_bins(self):
+        """
+        Brings the min/max of every bin up to date, only looking at the bins that received
+        values since the last call. Returns the number of bins.
+        """
+        n = len(self.data)
+        bins = int(max(1, min(n, int(self.right) - int(self.left))))
+
+        # update() may run on another thread meanwhile. It writes the value before counting
+        # it, so the values up to one snapshot of count are in place, and the pointer is
+        # derived from that snapshot rather than read separately.
+        count = self.count
+        pointer = count % n
+
+        if self.bin_starts is None or len(self.bin_starts) != bins + 1:
+            self.bin_starts = (np.arange(bins + 1) * n + bins - 1) // bins
+            self.bin_min = np.empty(bins, dtype = np.float32)
+            self.bin_max = np.empty(bins, dtype = np.float32)
+            stale_bins = np.arange(bins)
+        else:
+            new_count = min(count - self.plotted_count, n)
+            stale_bins = np.unique((pointer - new_count + np.arange(new_count)) % n * bins // n)
+
+        self.plotted_count = count
+
+        if stale_bins.shape[0] > 0:
+            starts = self.bin_starts[stale_bins]
+            lengths = self.bin_starts[stale_bins + 1] - starts
+            offsets = np.cumsum(lengths) - lengths
+            values = self.data[np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)]
+            self.bin_min[stale_bins] = np.fmin.reduceat(values, offsets)
+            self.bin_max[stale_bins] = np.fmax.reduceat(values, offsets)
+
+        return bins
 
     def plot(self):
-        points = []
+        bins = self.update_bins()
 
         ymin = self.ymin
         ymax = self.ymax
 
         if ymin is None or ymax is None:
             # Autoscale
-            ymax = self.get_nice_scale_bound(np.nanmax(np.abs(self.data)))
+            data_min = np.fmin.reduce(self.bin_min)
+            data_max = np.fmax.reduce(self.bin_max)
+            ymax = self.get_nice_scale_bound(max(abs(data_min), abs(data_max)))
 
-            if np.nanmin(self.data) < 0:
+            if data_min < 0:
                 ymin = -ymax
             else:
                 ymin = 0.0
 
-        for i in range(len(self.data)):
-           if not np.isnan(self.data[i]):
-               points.append(
-                 (int(float(i)/len(self.data)*(self.right - self.left) + self.left),
-                 int((1.0 - (self.data[i] - ymin) / (ymax - ymin)) * (self.bottom - self.top) + self.top))
-               )
-            
+        def to_screen_y(values):
+            return (1.0 - (values - ymin) / (ymax - ymin)) * (self.bottom - self.top) + self.top
+
         self.g.set_color(termgraphics.COLOR_WHITE)
-        for i in range(len(points) - 1):
-            self.g.line(points[i], points[i+1])
+
+        if bins == len(self.data):
+            # at most one value per dot: connect the values
+            where_valid = np.flatnonzero(~np.isnan(self.data))
+            points = np.vstack((
+                where_valid / float(len(self.data)) * (self.right - self.left) + self.left,
+                to_screen_y(self.data[where_valid]),
+            )).T.astype(np.intp)
+            self.g.polyline(points)
+        else:
+            # one vertical line per dot column spanning the bin's min and max, extended to
+            # meet the previous column so that the trace stays connected
+            lows = self.bin_min.copy()
+            highs = self.bin_max.copy()
+            lows[1:] = np.fmin(lows[1:], self.bin_max[:-1])
+            highs[1:] = np.fmax(highs[1:], self.bin_min[:-1])
+            where_valid = np.flatnonzero(~np.isnan(lows))
+            xs = int(self.left) + where_valid
+            y_tops = to_screen_y(highs[where_valid]).astype(np.intp)
+            y_bottoms = to_screen_y(lows[where_valid]).astype(np.intp)
+            self.g.lines(np.vstack((xs, y_tops, xs, y_bottoms + 1)).T)
 
         if self.title:
             self.g.set_color((127, 127, 127))
@@ -90,4 +177,3 @@ class ScopePlotter(object):
         self.g.text("{:2.4f}".format(ymax).rstrip("0").rstrip("."), (int(self.left), int(self.top)))
         self.g.text("{:2.4f}".format((ymax + ymin)/2).rstrip("0").rstrip("."), (int(self.left), int(self.top + (self.bottom - self.top) / 2 )))
         self.g.text("{:2.4f}".format(ymin).rstrip("0").rstrip("."), (int(self.left), int(self.bottom)))
-
@@ -0,0 +1,120 @@
+import collections
+import json
+import time
+
+timer = getattr(time, "perf_counter", time.time)
+
+class NullStage(object):
+    """
+    Stage that does nothing, handed out while profiling is off.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NULL_STAGE = NullStage()
+
+class Stage(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = timer()
+        return self
+
+    def __exit__(self, *args):
+        stages = self.profiler.stages
+        stages[self.name] = stages.get(self.name, 0.) + timer() - self.start_time
+        return False
+
+class Profiler(object):
+    """
+    Times the stages of every frame (decode, project, raster, diff, encode, write, ...) and
+    counts the work done (points, cells_dirty, bytes). Code being profiled does
+
+        with profiler.stage("decode"):
+            ...
+        profiler.count("points", n)
+
+    and end_frame() closes the frame. The last history frames are kept for summary(), which
+    makes the one-line HUD, and every frame is appended to trace_file as a line of JSON if
+    given.
+
+    Profiling is only on while the HUD is shown or a trace is written. Otherwise stage()
+    returns a shared no-op context manager, so instrumented code costs next to nothing.
+    """
+    def __init__(self, history = 32, trace_file = None):
+        self.hud = False
+        self.trace = None if trace_file is None else open(trace_file, "w")
+        self.enabled = self.trace is not None
+        self.frames = collections.deque(maxlen = history)
+        self.frame_count = 0
+        self.stages = {}
+        self.counts = {}
+        self.last_frame_time = timer()
+
+    def toggle_hud(self):
+        self.hud = not self.hud
+        self.enabled = self.hud or self.trace is not None
+        self.stages = {}
+        self.counts = {}
+        self.last_frame_time = timer()
+
+    def stage(self, name):
+        """
+        Returns a context manager that adds the time spent in it to the given stage.
+        """
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def count(self, name, n = 1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        now = timer()
+        frame = {
+            "frame": self.frame_count,
+            "time": time.time(),
+            "ms": (now - self.last_frame_time) * 1e3,
+            "stages": dict((name, seconds * 1e3) for name, seconds in self.stages.items()),
+            "counts": self.counts,
+        }
+        self.frames.append(frame)
+        if self.trace is not None:
+            self.trace.write(json.dumps(frame) + "\n")
+        self.frame_count += 1
+        self.stages = {}
+        self.counts = {}
+        self.last_frame_time = now
+
+    def summary(self):
+        """
+        Returns a line with the frame rate, the time per stage and the counts, averaged over
+        the frames kept.
+        """
+        if not self.frames:
+            return ""
+        n = float(len(self.frames))
+        stages = collections.OrderedDict()
+        counts = collections.OrderedDict()
+        for frame in self.frames:
+            for name, ms in frame["stages"].items():
+                stages[name] = stages.get(name, 0.) + ms
+            for name, value in frame["counts"].items():
+                counts[name] = counts.get(name, 0) + value
+        frame_ms = sum(frame["ms"] for frame in self.frames) / n
+        return "%.1ffps " % (1e3 / max(frame_ms, 1e-3)) + \
+            " ".join("%s %.1fms" % (name, ms / n) for name, ms in stages.items()) + " | " + \
+            " ".join("%s %d" % (name, value / n) for name, value in counts.items())
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
@@ -16,46 +16,36 @@ import random
 import threading
 from rosshow.getch import Getch
 import rosshow.termgraphics as termgraphics
+from rosshow.bandwidth import BandwidthGovernor
+from rosshow.profiler import Profiler
+from rosshow.viewers import VIEWER_MAPPING
+from rosshow.viewers.generic.DecodePool import DecodePool
 
 getch = Getch()
 
-VIEWER_MAPPING = {
-
-  "nav_msgs/Odometry": ("rosshow.viewers.nav_msgs.OdometryViewer", "OdometryViewer", {}),
-  "nav_msgs/OccupancyGrid": ("rosshow.viewers.nav_msgs.OccupancyGridViewer", "OccupancyGridViewer", {}),
-  "nav_msgs/Path": ("rosshow.viewers.nav_msgs.PathViewer", "PathViewer", {}),
-  "std_msgs/Bool": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "std_msgs/Float32": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "std_msgs/Float64": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "std_msgs/Int8": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "std_msgs/Int16": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "std_msgs/Int32": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "std_msgs/Int64": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "std_msgs/UInt8": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "std_msgs/UInt16": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "std_msgs/UInt32": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "std_msgs/UInt64": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {}),
-  "sensor_msgs/CompressedImage": ("rosshow.viewers.sensor_msgs.CompressedImageViewer", "CompressedImageViewer", {}),
-  "sensor_msgs/FluidPressure": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {"data_field": "fluid_pressure"}),
-  "sensor_msgs/RelativeHumidity": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {"data_field": "relative_humidity"}),
-  "sensor_msgs/Illuminance": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {"data_field": "illuminance"}),
-  "sensor_msgs/Image": ("rosshow.viewers.sensor_msgs.ImageViewer", "ImageViewer", {}),
-  "sensor_msgs/Imu": ("rosshow.viewers.sensor_msgs.ImuViewer", "ImuViewer", {}),
-  "sensor_msgs/LaserScan": ("rosshow.viewers.sensor_msgs.LaserScanViewer", "LaserScanViewer", {}),
-  "sensor_msgs/NavSatFix": ("rosshow.viewers.sensor_msgs.NavSatFixViewer", "NavSatFixViewer", {}),
-  "sensor_msgs/PointCloud2": ("rosshow.viewers.sensor_msgs.PointCloud2Viewer", "PointCloud2Viewer", {}),
-  "sensor_msgs/Range": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {"data_field": "range"}),
-  "sensor_msgs/Temperature": ("rosshow.viewers.generic.SinglePlotViewer", "SinglePlotViewer", {"data_field": "temperature"}),
-  "geometry_msgs/Twist": ("rosshow.viewers.generic.MultiPlotViewer", "MultiPlotViewer", {"data_fields": ["linear.x", "linear.y", "linear.z", "angular.x", "angular.y", "angular.z"]}),
-}
-
-def capture_key_loop(viewer):
+# options that are followed by a value
+VALUE_OPTIONS = ["--history", "--color-threshold", "--max-kbps", "--trace", "--workers", "--tile-url"]
+
+def get_option_value(name, default = None, type = str):
+    """
+    Returns the value given after option name on the command line, e.g. 1000 for
+    --history 1000, or default if the option is not there.
+    """
+    if name in sys.argv[:-1]:
+        return type(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+def capture_key_loop(viewer, canvas):
     global getch
     while True:
         c = getch()
         if c == '\x03': # Ctrl+C
             rospy.signal_shutdown("Ctrl+C pressed")
 
+        if c == 'p': # profiler HUD
+            canvas.profiler.toggle_hud()
+            continue
+
         if "keypress" not in dir(viewer):
             continue
 
@@ -85,12 +75,22 @@ def main():
             print("   -a:   Use ASCII only (no Unicode)")
             print("   -c1:  Force monochrome")
             print("   -c4:  Force 4-bit color (16 colors)")
+            print("   -c8:  Force 8-bit color (256 colors)")
             print("   -c24: Force 24-bit color")
+            print("   --sync: Use synchronized terminal updates (reduces tearing on terminals that support it)")
+            print("   --history <n>: Number of samples kept in time series plots (default: 128)")
+            print("   --max-kbps <n>: Adapt frame rate and colors to stay within n kilobits per second")
+            print("   --trace <file>: Write per-frame stage timings to file as JSON lines (press p for a live summary)")
+            print("   --workers <n>: Decode and scale images and point clouds in n worker processes (python 3.8+)")
+            print("   --tile-url <url>: Map tile server for NavSatFix, e.g. http://localhost:8080/{z}/{x}/{y}.png")
+            print("   --color-threshold <d>: Don't re-send 24-bit colors that changed by less than d (0-765, default: 0)")
             print("   --reliable: reliability QoS in ros2 (default: best_effort)")
             print("   --transient-local: durability QoS in ros2 (default: volatile)")
             sys.exit(0)
         TOPIC = sys.argv[argi]
         argi+= 1
+        if TOPIC in VALUE_OPTIONS:
+            argi += 1
 
     if ("-a" in sys.argv) or ("--ascii" in sys.argv):
         USE_ASCII = True
@@ -101,6 +101,8 @@ def main():
         color_support = termgraphics.COLOR_SUPPORT_1
     elif "-c4" in sys.argv:
         color_support = termgraphics.COLOR_SUPPORT_16
+    elif "-c8" in sys.argv:
+        color_support = termgraphics.COLOR_SUPPORT_256
     elif "-c24" in sys.argv:
         color_support = termgraphics.COLOR_SUPPORT_24BIT
     else:
@@ -114,6 +116,16 @@ def main():
     if "--transient-local" in sys.argv:
         qos_transient_local = True
 
+    # Check the tile server URL before connecting to anything
+    tile_url = get_option_value("--tile-url")
+    if tile_url is not None:
+        from rosshow.viewers.sensor_msgs.tile_loader import tile_url as format_tile_url
+        try:
+            format_tile_url(tile_url, 0, 0, 0)
+        except ValueError as e:
+            print(str(e))
+            sys.exit(1)
+
     rospy.init_node('rosshow', anonymous=True)
 
     # Get information on all topic types
@@ -138,10 +150,31 @@ def main():
 
     canvas = termgraphics.TermGraphics( \
             mode = (termgraphics.MODE_EASCII if USE_ASCII else termgraphics.MODE_UNICODE),
-            color_support = color_support)
+            color_support = color_support,
+            sink = termgraphics.TtySink(synchronized = "--sync" in sys.argv),
+            color_threshold = get_option_value("--color-threshold", default = 0, type = float),
+            profiler = Profiler(trace_file = get_option_value("--trace")))
+    canvas.watch_resize()
 
     module_name, class_name, viewer_kwargs = VIEWER_MAPPING[topic_type]
     viewer_class = getattr(__import__(module_name, fromlist=(class_name)), class_name)
+
+    history = get_option_value("--history", type = int)
+    if history is not None and "history" in viewer_class.__init__.__code__.co_varnames:
+        viewer_kwargs = dict(viewer_kwargs, history = history)
+
+    if tile_url is not None and "tile_url" in viewer_class.__init__.__code__.co_varnames:
+        viewer_kwargs = dict(viewer_kwargs, tile_url = tile_url)
+
+    decode_pool = None
+    workers = get_option_value("--workers", default = 0, type = int)
+    if workers > 0 and "decode_pool" in viewer_class.__init__.__code__.co_varnames:
+        if DecodePool.available():
+            decode_pool = DecodePool(workers)
+            viewer_kwargs = dict(viewer_kwargs, decode_pool = decode_pool)
+        else:
+            print("Decode workers need python 3.8 or newer, decoding in-process.")
+
     viewer = viewer_class(canvas, title = TOPIC, **viewer_kwargs)
 
     message_package, message_name = topic_type.split("/", 2)
@@ -159,20 +192,40 @@ def main():
     # Subscribe to the topic so the viewer actually gets the data
     rospy.Subscriber(TOPIC, message_class, viewer.update, **kwargs)
 
+    # and to any companion topics the viewer wants, if their message types are installed
+    extra_subscribers = []
+    if "subscriptions" in dir(viewer):
+        for extra_topic, extra_type, callback in viewer.subscriptions(TOPIC):
+            extra_package, extra_name = extra_type.split("/", 2)
+            try:
+                extra_class = getattr(__import__(extra_package + ".msg", fromlist=(extra_name)), extra_name)
+            except ImportError:
+                continue
+            extra_subscribers.append(rospy.Subscriber(extra_topic, extra_class, callback, **kwargs))
+
     # Listen for keypresses
 
-    thread = threading.Thread(target = capture_key_loop, args = (viewer,))
+    thread = threading.Thread(target = capture_key_loop, args = (viewer, canvas))
     thread.daemon = True
     thread.start()
 
     # Drawing loop
     frame_rate = 15.
     frame_duration = 1. / frame_rate
+    governor = None
+    max_kbps = get_option_value("--max-kbps", type = float)
+    if max_kbps:
+        governor = BandwidthGovernor(canvas, max_kbps, max_frame_rate = frame_rate)
     try:
         while not rospy.is_shutdown():
             start_time = time.time()
+            if canvas.check_resize() and "resize" in dir(viewer):
+                viewer.resize()
             viewer.draw()
             stop_time = time.time()
+            if governor is not None:
+                frame_duration = governor.update()
+                canvas.status = governor.status()
             draw_time = stop_time - start_time
             delay_time = max(0, frame_duration - draw_time)
             time.sleep(delay_time)
@@ -181,7 +234,15 @@ def main():
 
     finally:
         getch.reset()
-        sys.stdout.write("\033[%d;0H\n" % canvas.term_shape[1])
+        canvas.profiler.close()
+        if "close" in dir(viewer):
+            viewer.close()
+        if decode_pool is not None:
+            decode_pool.close()
+        sys.stdout.write("\033[0m\033[%d;0H\n" % canvas.term_shape[1])
+        if canvas.total_stats["lossy_cells_skipped"]:
+            sys.stdout.write("Color threshold saved about {0} kB ({1} kB sent)\n".format(
+                canvas.total_stats["lossy_bytes_saved"] // 1024, canvas.total_stats["bytes"] // 1024))
         sys.stdout.flush()
 
 if __name__ == "__main__":
@@ -12,9 +12,12 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import math
 import numpy as np
 import os
+import signal
 import sys
 import time
 
+from rosshow.profiler import Profiler
+
 if sys.version_info >= (3,):
     unichr = chr
 
@@ -53,44 +56,323 @@ UNICODE_BRAILLE_MAP= np.array([ \
     0b10000000,
 ], dtype = np.uint8)
 
+# bit of the braille character for each dot ((x & 0b1) | ((y & 0b11) << 1)), i.e. log2(UNICODE_BRAILLE_MAP)
+UNICODE_BRAILLE_BITS = np.array([0, 3, 1, 4, 2, 5, 6, 7], dtype = np.uint8)
+
+_GLYPH_TABLES = {}
+
+def _glyph_table(mode):
+    """
+    Returns arrays that map every possible buffer value to the UTF-8 bytes drawn for it and
+    to the number of those bytes. Built once per mode and then indexed directly by the buffer.
+    """
+    if mode not in _GLYPH_TABLES:
+        glyphs = [" "] * 0x10000
+        if mode == MODE_EASCII:
+            glyphs[0x0001:0x0100] = [chr(b) for b in range(0x01, 0x100)]
+            glyphs[0x2800:0x2900] = list(TABLE_EASCII)
+            glyphs[0x2588] = "#"
+        else:
+            glyphs = [unichr(b) for b in range(0x10000)]
+        _GLYPH_TABLES[mode] = _escape_table(glyphs)
+    return _GLYPH_TABLES[mode]
+
+def _escape_table(strings):
+    """
+    Encodes a list of strings to UTF-8 and returns them as an array along with their lengths
+    in bytes.
+    """
+    table = np.empty(len(strings), dtype = object)
+    table[:] = [s.encode("utf-8", "replace") for s in strings]
+    return table, np.array([len(s) for s in table.tolist()], dtype = np.int32)
+
+def _palette_256_colors():
+    """
+    Returns the RGB colors of the xterm 256-color palette as a 256 x 3 array. The 16 system
+    colors (0-15) are left black since every terminal has its own idea of what they look like.
+    """
+    levels = np.array([0, 95, 135, 175, 215, 255])
+    cube = np.stack(np.meshgrid(levels, levels, levels, indexing = "ij"), axis = -1).reshape(-1, 3) # 16-231
+    grays = np.repeat(8 + 10 * np.arange(24), 3).reshape(-1, 3) # 232-255
+    return np.vstack((np.zeros((16, 3), dtype = np.int64), cube, grays)).astype(np.uint8)
+
+_PALETTE_256_LUT = None
+
+def _palette_256_lut():
+    """
+    Returns a 32 x 32 x 32 lookup table from RGB colors (top 5 bits of each channel) to the
+    nearest color of the xterm 256-color palette, leaving out the system colors.
+    """
+    global _PALETTE_256_LUT
+    if _PALETTE_256_LUT is None:
+        palette = _palette_256_colors().astype(np.float32)
+        centers = np.arange(32, dtype = np.float32) * 8 + 4
+
+        # the nearest color of the 6 x 6 x 6 cube is the nearest level in each channel
+        levels = palette[16:22, 2]
+        level_distances = (centers[:, None] - levels[None, :]) ** 2
+        nearest_levels = np.argmin(level_distances, axis = 1)
+        cube_distances = level_distances[np.arange(32), nearest_levels]
+        cube = 16 + 36 * nearest_levels[:, None, None] + 6 * nearest_levels[None, :, None] + nearest_levels[None, None, :]
+        cube_distance = cube_distances[:, None, None] + cube_distances[None, :, None] + cube_distances[None, None, :]
+
+        # the nearest of the 24 grays
+        grays = palette[232:, 0]
+        gray_distances = (centers[:, None] - grays[None, :]) ** 2
+        gray_distance = gray_distances[:, None, None, :] + gray_distances[None, :, None, :] + gray_distances[None, None, :, :]
+        gray = 232 + np.argmin(gray_distance, axis = 3)
+        gray_distance = np.min(gray_distance, axis = 3)
+
+        # on a tie the cube wins, as it comes first in the palette
+        _PALETTE_256_LUT = np.where(gray_distance < cube_distance, gray, cube).astype(np.uint8)
+    return _PALETTE_256_LUT
+
+def color_distance(rgb0, rgb1):
+    """
+    Perceptual distance between arrays of RGB colors, using the "redmean" weighted Euclidean
+    approximation. Ranges from 0 to about 765; differences below 10-20 are hard to notice.
+    """
+    rgb0 = np.asarray(rgb0, dtype = np.int32)
+    rgb1 = np.asarray(rgb1, dtype = np.int32)
+    redmean = (rgb0[..., 0] + rgb1[..., 0]) >> 1
+    d = rgb0 - rgb1
+    return np.sqrt((((512 + redmean) * d[..., 0] ** 2) >> 8) + 4 * d[..., 1] ** 2 + \
+        (((767 - redmean) * d[..., 2] ** 2) >> 8))
+
+def get_terminal_size():
+    """
+    Returns the size of the terminal as (columns, lines), read with the TIOCGWINSZ ioctl
+    on stdout or, if that isn't a terminal, stdin.
+    """
+    for stream in (sys.stdout, sys.stdin):
+        try:
+            fd = stream.fileno()
+            if hasattr(os, "get_terminal_size"):
+                return tuple(os.get_terminal_size(fd))
+            import fcntl, struct, termios # python 2
+            lines, columns = struct.unpack("hh", fcntl.ioctl(fd, termios.TIOCGWINSZ, b"\0" * 4))
+            return (columns, lines)
+        except (AttributeError, ValueError, IOError, OSError):
+            continue
+    return (80, 24)
+
+SYNC_BEGIN = b"\033[?2026h"
+SYNC_END = b"\033[?2026l"
+
+class OutputSink(object):
+    """
+    Destination for rendered frames. Every frame is copied into a bytearray that is reused
+    from frame to frame and handed to write() in one piece.
+
+    If synchronized is True, frames are wrapped in the DEC synchronized output sequences
+    (mode 2026) so that terminals which support them show each frame at once. Other
+    terminals ignore them.
+
+    bytes_written and write_time add up the bytes sent and the seconds spent blocked in
+    write(), which grows when the terminal or the connection to it can't keep up.
+    """
+    def __init__(self, synchronized = False):
+        self.synchronized = synchronized
+        self.frame = bytearray(0)
+        self.bytes_written = 0
+        self.write_time = 0.
+
+    def write_frame(self, data):
+        """
+        Sends the bytes of one frame. Returns the number of bytes written.
+        """
+        if not data:
+            return 0
+
+        pieces = (SYNC_BEGIN, data, SYNC_END) if self.synchronized else (data,)
+        size = sum(len(piece) for piece in pieces)
+        if len(self.frame) < size:
+            self.frame = bytearray(2 * size)
+
+        view = memoryview(self.frame)
+        offset = 0
+        for piece in pieces:
+            view[offset:offset + len(piece)] = piece
+            offset += len(piece)
+
+        start_time = time.time()
+        self.write(view[:size])
+        self.write_time += time.time() - start_time
+        self.bytes_written += size
+        return size
+
+    def write(self, data):
+        raise NotImplementedError()
+
+class TtySink(OutputSink):
+    """
+    Writes frames straight to a terminal file descriptor (stdout by default) with os.write().
+    """
+    def __init__(self, fd = None, synchronized = False):
+        OutputSink.__init__(self, synchronized = synchronized)
+        self.fd = sys.stdout.fileno() if fd is None else fd
+
+    def write(self, data):
+        data = memoryview(data)
+        while len(data) > 0:
+            data = data[os.write(self.fd, data):]
+
+class FileSink(OutputSink):
+    """
+    Records frames to a binary file, e.g. to replay them later with cat.
+    """
+    def __init__(self, file, synchronized = False):
+        OutputSink.__init__(self, synchronized = synchronized)
+        self.file = open(file, "wb") if isinstance(file, str) else file
+
+    def write(self, data):
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class MemorySink(OutputSink):
+    """
+    Keeps frames in memory. self.frames holds the bytes of the most recent max_frames frames
+    (all of them if max_frames is None).
+    """
+    def __init__(self, synchronized = False, max_frames = None):
+        OutputSink.__init__(self, synchronized = synchronized)
+        self.max_frames = max_frames
+        self.frames = []
+
+    def write(self, data):
+        self.frames.append(bytes(data))
+        if self.max_frames is not None and len(self.frames) > self.max_frames:
+            del self.frames[:-self.max_frames]
+
+    def getvalue(self):
+        return b"".join(self.frames)
+
 class TermGraphics(object):
-    def __init__(self, mode = MODE_UNICODE, color_support = None):
+    def __init__(self, mode = MODE_UNICODE, color_support = None, sink = None, refresh_interval = 100, color_threshold = 0, size = None, profiler = None):
         """
-        Initialization. This class takes no arguments.
+        Initialization. Frames are written to sink, which defaults to a TtySink on stdout.
+
+        If size = (columns, lines) is given, the canvas is headless: it has that fixed size
+        and never looks at the terminal, and frames go to a MemorySink that keeps the last
+        one unless another sink is given. This is for tests and benchmarks.
+
+        profiler is a rosshow.profiler.Profiler that viewers and draw() report stage timings
+        to; a new one, switched off, by default. While its HUD is on it is shown on the top
+        line.
+
+        Every line of the screen is re-sent in full once every refresh_interval frames to
+        repair anything that got garbled on the terminal. Lines take turns so that the cost
+        is spread evenly over frames. Set it to None to disable refreshing.
+
+        In 24-bit color mode, a cell whose glyph is unchanged and whose color is within
+        color_threshold (see color_distance) of the color on the screen is not re-sent.
+        This keeps sensor noise from re-sending the whole screen every frame. The periodic
+        refresh puts back the exact colors. After each draw, frame_stats holds the number
+        of cells and bytes sent and an estimate of the bytes saved by the threshold;
+        total_stats adds these up over all frames.
         """
+        self.refresh_interval = refresh_interval
+        self.color_threshold = color_threshold
+        self.frame_stats = {"cells_dirty": 0, "bytes": 0, "lossy_cells_skipped": 0, "lossy_bytes_saved": 0}
+        self.total_stats = dict(self.frame_stats)
+        self.status = None
+        self.status_width = 0
+        self.profiler = Profiler() if profiler is None else profiler
+        self.resize_pending = False
+        self.size = size
         self.shape = (0, 0)
         self.term_shape = (0, 0)
         self.update_shape()
         self.current_color = np.array([255, 255, 255], dtype = np.uint8)
         self.mode = mode
         self.seq = 0
+        if sink is None:
+            sink = TtySink() if size is None else MemorySink(max_frames = 1)
+        self.sink = sink
 
         # use user-provided color support if given
         self.color_support = color_support
 
         # or attempt to auto-detect
         if self.color_support is None:
-            if self.term_type in ['xterm-256color', 'xterm'] or self.term_color in ['truecolor', '24bit']:
+            # COLORTERM often doesn't make it through SSH, and terminals that call themselves
+            # xterm* nearly all do 24-bit color, so they get it as they always have
+            if (self.term_type is not None and self.term_type.startswith('xterm')) or self.term_color in ['truecolor', '24bit']:
                 self.color_support = COLOR_SUPPORT_24BIT
+            elif self.term_type is not None and self.term_type.endswith('256color'):
+                self.color_support = COLOR_SUPPORT_256
             else:
                 self.color_support = COLOR_SUPPORT_16
 
+    def set_color_support(self, color_support):
+        """
+        Changes the color depth without redrawing the whole screen: the colors on the screen
+        are re-keyed for the new depth, so only cells that change look different in it and
+        get re-sent, and the periodic refresh brings the rest over to the new depth. Only a
+        change from or to monochrome, where the colors on the screen aren't known, redraws
+        everything on the next draw().
+        """
+        if color_support == self.color_support:
+            return
+        if self.last_buffer is None or COLOR_SUPPORT_1 in (color_support, self.color_support):
+            self.color_support = color_support
+            self.last_buffer = None
+            return
+        shown_colors = self._key_colors(self.last_keys)
+        self.color_support = color_support
+        self.last_keys = self._color_keys(shown_colors)
+        self.last_color_key = None
+
     def _rgb_to_8(self, rgb):
         return (rgb[2] >= 127) << 2 | (rgb[1] >= 127)<<1 | (rgb[0] >= 127)
 
     def clear(self):
         """
-        Clear the graphics buffer.
+        Clear the graphics buffer. Only the lines drawn on since the last clear are touched.
+        """
+        rows = self.content_rows
+        self.buffer[rows] = 0x2800
+        self.colors[rows] = 0
+        self.damaged_rows |= rows
+        rows[:] = False
+
+    def _damage(self, rows):
+        """
+        Records that the given lines (an index, slice or array of indices) of the buffer
+        have been drawn on, so that draw() and clear() look at them.
+        """
+        self.damaged_rows[rows] = True
+        self.content_rows[rows] = True
+
+    def watch_resize(self):
+        """
+        Installs a SIGWINCH handler so that check_resize() knows when the terminal has been
+        resized. Must be called from the main thread.
+        """
+        if self.size is None and hasattr(signal, "SIGWINCH"):
+            signal.signal(signal.SIGWINCH, self._on_resize)
+
+    def _on_resize(self, signum, frame):
+        self.resize_pending = True
+
+    def check_resize(self):
+        """
+        Updates the shape if a resize was signalled since the last call. Returns True if the
+        shape has changed.
         """
-        self.buffer &= 0
-        self.buffer |= 0x2800
-        self.colors &= 0
+        if not self.resize_pending:
+            return False
+        self.resize_pending = False
+        return self.update_shape()
 
     def update_shape(self):
         """
         Fetches the terminal shape. Returns True if the shape has changed.
         """
-        self.term_shape = tuple(reversed(list(map(lambda x: int(x), os.popen('stty size', 'r').read().split()))))
+        self.term_shape = get_terminal_size() if self.size is None else tuple(self.size)
         self.term_type = os.environ.get('TERM')
         self.term_color = os.environ.get('COLORTERM')
         new_shape = (self.term_shape[0]*2, self.term_shape[1]*4)
@@ -98,9 +380,18 @@ class TermGraphics(object):
             self.shape = (self.term_shape[0]*2, self.term_shape[1]*4)
             self.buffer = np.frombuffer((b'\x28\x00' * (self.term_shape[0] * self.term_shape[1])), dtype = np.uint16).reshape((self.term_shape[1], self.term_shape[0])).copy()
             self.colors = np.frombuffer((b'\xff\xff\xff' * (self.term_shape[0] * self.term_shape[1])), dtype = np.uint8).reshape((self.term_shape[1], self.term_shape[0], 3)).copy()
-            self.igrid, self.jgrid = np.meshgrid(np.arange(self.buffer.shape[1]), np.arange(self.buffer.shape[0]))
+            # absolute cursor position is cursor_row_table[j] + cursor_col_table[i]
+            self.cursor_row_table = _escape_table(["\033[" + str(j + 1) + ";" for j in range(self.term_shape[1])])
+            self.cursor_col_table = _escape_table([str(i + 1) + "H" for i in range(self.term_shape[0])])
+            # relative cursor movements by n columns to the right or n lines down (to column 0)
+            self.cursor_forward_table = _escape_table([""] + ["\033[C"] + ["\033[" + str(n) + "C" for n in range(2, self.term_shape[0] + 1)])
+            self.cursor_down_table = _escape_table(["\r"] + ["\r\033[B"] + ["\r\033[" + str(n) + "B" for n in range(2, self.term_shape[1] + 1)])
+            # lines changed since the last draw() and lines with content since the last clear()
+            self.damaged_rows = np.ones(self.term_shape[1], dtype = bool)
+            self.content_rows = np.ones(self.term_shape[1], dtype = bool)
             self.last_buffer = None
-            self.last_colors = None
+            self.last_keys = None
+            self.last_color_key = None
             return True
         return False
 
@@ -112,37 +403,69 @@ class TermGraphics(object):
         Draws a list of points = [(x0,y0), (x1,y1), (x2,y2), ...].
         """
         if type(points) is list:
-            points = np.array(points, dtype = np.uint16)
+            # not uint16: off-screen points can be negative or beyond its range, which numpy 2
+            # refuses to cast instead of wrapping around
+            points = np.array(points).reshape(-1, 2).astype(np.intp)
 
-        i_array = points[:, 0] >> 1
-        j_array = points[:, 1] >> 2
+        x_array = points[:, 0]
+        y_array = points[:, 1]
 
-        where_valid = (i_array >= 0) & (j_array >= 0) & \
-            (i_array < self.term_shape[0]) & (j_array < self.term_shape[1])
+        where_valid = (x_array >= 0) & (y_array >= 0) & \
+            (x_array < self.shape[0]) & (y_array < self.shape[1])
 
-        i_array = i_array[where_valid]
-        j_array = j_array[where_valid]
-        points = points[where_valid, :]
-        if colors is not None:
-            colors = colors[where_valid, :]
+        # index of each point in a bitmap of all the dots on the screen
+        dots = y_array.astype(np.intp) * self.shape[0] + x_array
+        if not where_valid.all():
+            dots = dots[where_valid]
+            if colors is not None:
+                colors = colors[where_valid, :]
+
+        if dots.shape[0] == 0:
+            return
+        self.profiler.count("points", dots.shape[0])
+
+        # work on the block of lines spanned by the points
+        first_row = int(dots.min()) // (4 * self.shape[0])
+        last_row = int(dots.max()) // (4 * self.shape[0])
+        block = self.buffer[first_row:last_row + 1]
+        block_colors = self.colors[first_row:last_row + 1]
+        dots -= first_row * 4 * self.shape[0]
+
+        # OR together the dots falling into each cell, so that each touched cell is written once
+        if dots.shape[0] * 16 < block.size:
+            # few points: sort the distinct (cell, bit) pairs by cell and add up the bits
+            dot_ys, dot_xs = np.divmod(dots, self.shape[0])
+            keys = (((dot_ys >> 2) * block.shape[1] + (dot_xs >> 1)) << 3) | \
+                UNICODE_BRAILLE_BITS[(dot_xs & 0b1) | ((dot_ys & 0b11) << 1)]
+            keys = np.unique(keys)
+            cells = keys >> 3
+            where_first = np.flatnonzero(np.diff(cells, prepend = -1))
+            cell_bits = np.add.reduceat(np.left_shift(1, keys & 0b111), where_first)
+            where_js, where_is = np.divmod(cells[where_first], block.shape[1])
+        else:
+            # many points: set the dots in a bitmap of the block and shift each of the 8 dots of
+            # every cell into its braille bit
+            bitmap = np.zeros(block.size * 8, dtype = bool)
+            bitmap[dots] = True
+            bitmap = bitmap.view(np.uint8).reshape(block.shape[0], 4, block.shape[1], 2)
+            cell_dots = np.zeros(block.shape, dtype = np.uint8)
+            for dot in range(8):
+                cell_dots |= bitmap[:, dot >> 1, :, dot & 0b1] << UNICODE_BRAILLE_BITS[dot]
+            where_js, where_is = np.nonzero(cell_dots)
+            cell_bits = cell_dots[where_js, where_is]
 
         if clear_block:
-            self.buffer[j_array, i_array] = 0x2800
+            block[where_js, where_is] = 0x2800
 
-        np.bitwise_or.at(
-            self.buffer,
-            (j_array, i_array),
-            UNICODE_BRAILLE_MAP[(points[:, 0] & 0b1) | ((points[:, 1] & 0b11) << 1)]
-        )
+        block[where_js, where_is] = ((block[where_js, where_is] | cell_bits) & 0x00FF) | 0x2800
 
-        np.bitwise_and.at(self.buffer, (j_array, i_array), 0x00FF)
-        np.bitwise_or.at(self.buffer, (j_array, i_array), 0x2800)
+        self._damage(first_row + where_js)
 
         if colors is not None:
-            self.colors[j_array, i_array, :] = colors
+            dot_ys, dot_xs = np.divmod(dots, self.shape[0])
+            block_colors.reshape(-1, 3)[(dot_ys >> 2) * block.shape[1] + (dot_xs >> 1)] = colors
         else:
-            self.colors[j_array, i_array, :] = self.current_color
-
+            block_colors[where_js, where_is, :] = self.current_color
 
     def point(self, point, clear_block = False):
         """
@@ -156,9 +479,10 @@ class TermGraphics(object):
         Draws text at point = (x0, y0).
         """
         i, j = point[0] >> 1, point[1] >> 2
-        if j >= self.term_shape[1]:
+        if i >= self.term_shape[0] or j >= self.term_shape[1]:
             return
         text = text[0:self.term_shape[0] - i]
+        self._damage(j)
         self.buffer[j, i:i+len(text)] = np.frombuffer(text.encode(), dtype = np.uint8)
         self.colors[j, i:i+len(text), :] = self.current_color
     
@@ -166,47 +490,88 @@ class TermGraphics(object):
         """
         Draws lines between a list of points = [(x0,y0), (x1,y1), (x2,y2), ...].
         """
-        for i in range(1, len(points)):
-            self.line(points[i-1], points[i])
-    
+        self.polyline(points)
+
+    def polyline(self, points):
+        """
+        Draws lines between consecutive points of a list or N x 2 array of points
+        = [(x0,y0), (x1,y1), (x2,y2), ...], all in one go.
+        """
+        points = np.asarray(points)
+        if points.shape[0] < 2:
+            return
+        self.lines(np.hstack((points[:-1], points[1:])))
+
     def line(self, point0, point1):
         """
         Draw a line between point0 = (x0, y0) and point1 = (x1, y1).
         """
-        if point1[0] == point0[0]:
-            if point0[1] < point1[1]:
-                for y in range(point0[1], point1[1]):
-                    self.point((point0[0], y))
-            else:
-                for y in range(point1[1], point0[1]):
-                    self.point((point0[0], y))
+        self.lines([(point0[0], point0[1], point1[0], point1[1])])
+
+    def lines(self, segments):
+        """
+        Draws a list or N x 4 array of line segments = [(x0,y0,x1,y1), ...] all in one go.
+
+        Each segment is stepped one dot at a time along its longer axis, from the lower end
+        up to (but not including) the upper end, and all the dots of all the segments are
+        handed to points() at once.
+        """
+        segments = np.asarray(segments)
+        if segments.shape[0] == 0:
             return
-        slope = (point1[1] - point0[1]) / (point1[0] - point0[0])
-        if abs(slope) <= 1:
-            if point0[0] < point1[0]:
-                for x in range(point0[0], point1[0]):
-                     self.point((x, point0[1] + slope*(x - point0[0])))
-            else:
-                for x in range(point1[0], point0[0]):
-                     self.point((x, point0[1] + slope*(x - point0[0])))
-        else:
-            if point0[1] < point1[1]:
-                for y in range(point0[1], point1[1]):
-                     self.point((point0[0] + (y - point0[1])/slope, y))
-            else:
-                for y in range(point1[1], point0[1]):
-                     self.point((point0[0] + (y - point0[1])/slope, y))
-        return
-    
+        segments = segments.reshape(-1, 4).astype(np.intp)
+        x0, y0, x1, y1 = segments.T
+        dx = x1 - x0
+        dy = y1 - y0
+
+        # which axis each segment is stepped along, and over which range
+        along_x = (dx != 0) & (np.abs(dy) <= np.abs(dx))
+        start = np.where(along_x, np.minimum(x0, x1), np.minimum(y0, y1))
+        length = np.where(along_x, np.abs(dx), np.abs(dy))
+
+        # one entry per dot: the segment it belongs to and its coordinate along the stepped axis
+        segment_ids = np.repeat(np.arange(segments.shape[0]), length)
+        steps = np.arange(segment_ids.shape[0]) - np.repeat(np.cumsum(length) - length, length)
+        steps += start[segment_ids]
+
+        xs = np.empty(steps.shape[0], dtype = np.float64)
+        ys = np.empty(steps.shape[0], dtype = np.float64)
+        dot_along_x = along_x[segment_ids]
+        dot_vertical = (dx == 0)[segment_ids]
+        dot_along_y = ~dot_along_x & ~dot_vertical
+
+        ids = segment_ids[dot_along_x]
+        xs[dot_along_x] = steps[dot_along_x]
+        ys[dot_along_x] = y0[ids] + dy[ids] / dx[ids] * (steps[dot_along_x] - x0[ids])
+
+        ids = segment_ids[dot_along_y]
+        xs[dot_along_y] = x0[ids] + (steps[dot_along_y] - y0[ids]) / (dy[ids] / dx[ids])
+        ys[dot_along_y] = steps[dot_along_y]
+
+        xs[dot_vertical] = x0[segment_ids[dot_vertical]]
+        ys[dot_vertical] = steps[dot_vertical]
+
+        self.points(np.vstack((xs, ys)).T.astype(np.intp))
+
     def rect(self, point0, point1):
         """
         Draw a rectangle between corners point0 = (x0, y0) and point1 = (x1, y1).
         """
-        self.line((point0[0], point0[1]), (point0[0], point1[1]))
-        self.line((point0[0], point1[1]), (point1[0], point1[1]))
-        self.line((point1[0], point1[1]), (point1[0], point0[1]))
-        self.line((point1[0], point0[1]), (point0[0], point0[1]))
-    
+        self.lines(self.rect_segments(point0, point1))
+
+    @staticmethod
+    def rect_segments(point0, point1):
+        """
+        Returns the 4 line segments [(x0,y0,x1,y1), ...] that make up a rectangle between
+        corners point0 = (x0, y0) and point1 = (x1, y1), as drawn by rect().
+        """
+        return [
+            (point0[0], point0[1], point0[0], point1[1]),
+            (point0[0], point1[1], point1[0], point1[1]),
+            (point1[0], point1[1], point1[0], point0[1]),
+            (point1[0], point0[1], point0[0], point0[1]),
+        ]
+
     def image(self, data, width, height, point, image_type = IMAGE_MONOCHROME, clear_block = False):
         """
         Draw a binary image with the top-left corner at point = (x0, y0).
@@ -276,6 +641,7 @@ class TermGraphics(object):
             screen_is = screen_is[where_valid]
             screen_js = screen_js[where_valid]
             img = img[where_valid]
+            self._damage(screen_js)
             self.buffer[screen_js, screen_is] = 0x2588
             self.colors[screen_js, screen_is, :] = img
     
@@ -286,62 +652,233 @@ class TermGraphics(object):
 
         self.seq += 1
 
-        sys.stdout.write("\033[H")
-    
-        current_draw_color = -1
-   
-        if self.seq % 100 == 0 or self.last_colors is None or self.last_buffer is None:
+        if self.status:
+            # right-aligned on the bottom line, padded to cover longer earlier ones
+            self.status_width = max(self.status_width, len(self.status))
+            status = self.status.rjust(self.status_width)
+            self.current_color, color = (127, 127, 127), self.current_color
+            self.text(status, (2 * max(0, self.term_shape[0] - len(status)), self.shape[1] - 4))
+            self.current_color = color
+
+        if self.profiler.hud:
+            self.current_color, color = (255, 255, 0), self.current_color
+            self.text(self.profiler.summary().ljust(self.term_shape[0]), (0, 0))
+            self.current_color = color
+
+        with self.profiler.stage("diff"):
+            rows, where_diff, keys, where_lossy = self._diff()
+        with self.profiler.stage("encode"):
+            data = self._encode(rows, where_diff, keys)
+        with self.profiler.stage("write"):
+            size = self.sink.write_frame(data)
+        self.damaged_rows[:] = False
+
+        cells_dirty = int(np.count_nonzero(where_diff))
+        self.frame_stats["cells_dirty"] = cells_dirty
+        self.frame_stats["bytes"] = size
+        self.frame_stats["lossy_cells_skipped"] = 0
+        self.frame_stats["lossy_bytes_saved"] = 0
+        if where_lossy is not None:
+            lossy_cells = int(np.count_nonzero(where_lossy))
+            self.frame_stats["lossy_cells_skipped"] = lossy_cells
+            # a skipped cell would have cost about what an average sent cell costs, and at least
+            # its glyph and a 24-bit color escape if it's the only one
+            self.frame_stats["lossy_bytes_saved"] = \
+                lossy_cells * (size // cells_dirty if cells_dirty else 20)
+        for key in self.frame_stats:
+            self.total_stats[key] += self.frame_stats[key]
+
+        self.profiler.count("cells_dirty", cells_dirty)
+        self.profiler.count("bytes", size)
+        self.profiler.end_frame()
+
+    def _diff(self):
+        """
+        Finds the cells that differ from what's on the screen and updates the record of it.
+        Returns the lines to look at, the dirty cells and color keys of those lines, and the
+        cells skipped by color_threshold (or None).
+        """
+        where_lossy = None
+
+        if self.last_buffer is None:
+            rows = np.arange(self.term_shape[1])
+            keys = self._color_keys(self.colors)
             where_diff = np.ones(self.buffer.shape, dtype = bool)
+            self.last_color_key = None
+            self.last_buffer = self.buffer.copy()
+            self.last_keys = keys.copy()
         else:
-            where_diff = (self.buffer != self.last_buffer) | \
-                         (self.colors[:, :, 0] != self.last_colors[:, :, 0]) | \
-                         (self.colors[:, :, 1] != self.last_colors[:, :, 1]) | \
-                         (self.colors[:, :, 2] != self.last_colors[:, :, 2])
-
-        digrid = self.igrid[where_diff]
-        djgrid = self.jgrid[where_diff]
-        dbuffer = self.buffer[where_diff]
-        dcolors = self.colors[where_diff, :]
-
-        last_i = -1
-        last_j = -1
-        for n in range(digrid.shape[0]):
-            i, j, b, c = digrid[n], djgrid[n], dbuffer[n], dcolors[n]
-
-            # move cursor to new absolute position if it is a movement by more than 1
-            if last_j != j or i - last_i > 1:
-                sys.stdout.write("\033[" + str(j+1) + ";" + str(i+1) + "H")
-    
-            if np.any(c != current_draw_color):
-                current_draw_color = c
-                if self.color_support == COLOR_SUPPORT_24BIT:
-                  sys.stdout.write("\033[38;2;{};{};{}m".format(current_draw_color[0], current_draw_color[1], current_draw_color[2]))
-                elif self.color_support == COLOR_SUPPORT_256: # TODO support 256 colors but fall back to 16 for now
-                  sys.stdout.write("\033[3" + str(self._rgb_to_8(current_draw_color)) + "m")
-                elif self.color_support == COLOR_SUPPORT_16:  # TODO actually implement colors 9-15
-                  sys.stdout.write("\033[3" + str(self._rgb_to_8(current_draw_color)) + "m")
-                # else do nothing -- monochrome
-
-            if self.mode == MODE_UNICODE:
-                sys.stdout.write(unichr(b))
-            elif self.mode == MODE_EASCII:
-                if b & 0xFF00 == 0x2800:
-                    sys.stdout.write(TABLE_EASCII[b & 0x00FF])
-                elif b == 0x2588:
-                    sys.stdout.write("#")
-                elif b & 0xFF00 == 0x00 and b & 0x00FF != 0x00:
-                    sys.stdout.write(chr(b & 0x00FF))
-                else:
-                    sys.stdout.write(0x20)
-
-            last_i = i
-            last_j = j
-
-        sys.stdout.write("\033[37m")
-        sys.stdout.flush()
-
-        self.last_buffer = self.buffer.copy()
-        self.last_colors = self.colors.copy()
+            # every refresh_interval-th line gets re-sent in full, taking turns across frames
+            refresh = np.zeros(self.term_shape[1], dtype = bool)
+            if self.refresh_interval:
+                refresh[self.seq % self.refresh_interval::self.refresh_interval] = True
+                if refresh.any():
+                    # we can't trust what the terminal is showing, including its current color
+                    self.last_color_key = None
+
+            # only lines that have been drawn on can differ from what's on the screen
+            rows = np.flatnonzero(self.damaged_rows | refresh)
+            keys = self._color_keys(self.colors[rows])
+            last_keys = self.last_keys[rows]
+            where_diff = (self.buffer[rows] != self.last_buffer[rows]) | (keys != last_keys)
+            where_diff[refresh[rows]] = True
+
+            if self.color_threshold and self.color_support == COLOR_SUPPORT_24BIT:
+                # cells whose only change is a color close to the one on the screen are skipped;
+                # the screen keeps the old color, so that's what we remember for them
+                where_lossy = where_diff & (self.buffer[rows] == self.last_buffer[rows]) & \
+                    ~refresh[rows, None]
+                lossy_rs, lossy_is = np.nonzero(where_lossy)
+                lossy_rgb = self.colors[rows[lossy_rs], lossy_is].astype(np.int32)
+                old_keys = last_keys[lossy_rs, lossy_is]
+                old_rgb = np.stack(((old_keys >> 16) & 0xFF, (old_keys >> 8) & 0xFF, old_keys & 0xFF), axis = -1)
+                where_close = color_distance(lossy_rgb, old_rgb) <= self.color_threshold
+                where_lossy[:] = False
+                where_lossy[lossy_rs[where_close], lossy_is[where_close]] = True
+                where_diff &= ~where_lossy
+                keys = np.where(where_lossy, last_keys, keys)
+
+            self.last_buffer[rows] = self.buffer[rows]
+            self.last_keys[rows] = keys
+
+        return rows, where_diff, keys, where_lossy
+
+    def _color_keys(self, colors):
+        """
+        Reduces an array of RGB colors to integers that are equal exactly when the terminal
+        shows them as the same color: packed RGB in 24-bit mode, palette indices otherwise.
+        Frames are diffed on these, so colors the terminal can't tell apart don't count as
+        changes.
+        """
+        if self.color_support == COLOR_SUPPORT_24BIT:
+            colors = colors.astype(np.int32)
+            return (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+        elif self.color_support == COLOR_SUPPORT_256:
+            colors = colors >> 3
+            return _palette_256_lut()[colors[..., 0], colors[..., 1], colors[..., 2]].astype(np.int32)
+        elif self.color_support == COLOR_SUPPORT_16: # TODO actually implement colors 9-15
+            return self._rgb_to_8(np.moveaxis(colors, -1, 0)).astype(np.int32)
+        else: # monochrome
+            return np.zeros(colors.shape[:-1], dtype = np.int32)
+
+    def _key_colors(self, keys):
+        """
+        Returns the RGB colors (as uint8) that the terminal shows for an array of color keys,
+        the reverse of _color_keys() as far as the color depth allows.
+        """
+        if self.color_support == COLOR_SUPPORT_24BIT:
+            return np.stack(((keys >> 16) & 0xFF, (keys >> 8) & 0xFF, keys & 0xFF), axis = -1).astype(np.uint8)
+        elif self.color_support == COLOR_SUPPORT_256:
+            return _palette_256_colors()[keys]
+        elif self.color_support == COLOR_SUPPORT_16:
+            return (255 * np.stack((keys & 1, (keys >> 1) & 1, (keys >> 2) & 1), axis = -1)).astype(np.uint8)
+        else: # monochrome
+            return np.full(keys.shape + (3,), 255, dtype = np.uint8)
+
+    def _color_escape(self, key):
+        """
+        Returns the escape sequence that switches the terminal to the color with the given key.
+        """
+        if self.color_support == COLOR_SUPPORT_24BIT:
+            return "\033[38;2;{};{};{}m".format(key >> 16, (key >> 8) & 0xFF, key & 0xFF).encode()
+        elif self.color_support == COLOR_SUPPORT_256:
+            return ("\033[38;5;" + str(key) + "m").encode()
+        elif self.color_support == COLOR_SUPPORT_16:
+            return ("\033[3" + str(key) + "m").encode()
+        return b""
+
+    def _encode(self, rows, where_diff, keys):
+        """
+        Encodes the dirty cells where_diff (one line per entry of rows, in increasing order)
+        into the bytes of glyphs, cursor movements and color escapes. keys are the color keys
+        of those lines.
+
+        To get from one dirty cell to the next, the cheapest in bytes of three options is
+        picked: re-sending the unchanged cells in between (only if they are all in the color
+        the terminal is already set to), a relative cursor movement, or an absolute jump.
+        Colors are only sent when the terminal's current color actually changes.
+        """
+        rs, dis = np.nonzero(where_diff)
+        n = rs.shape[0]
+        if n == 0:
+            return b""
+
+        glyphs, glyph_lengths = _glyph_table(self.mode)
+        buffer = self.buffer[rows]
+        djs = rows[rs]
+
+        # bytes needed to re-send cells, and runs of cells sharing a color, along each line
+        cum_lengths = np.cumsum(glyph_lengths[buffer], axis = 1)
+        runs = np.zeros(keys.shape, dtype = np.int32)
+        runs[:, 1:] = np.cumsum(keys[:, 1:] != keys[:, :-1], axis = 1)
+
+        row_strings, row_lengths = self.cursor_row_table
+        col_strings, col_lengths = self.cursor_col_table
+        forward_strings, forward_lengths = self.cursor_forward_table
+        down_strings, down_lengths = self.cursor_down_table
+
+        # cost of each way of getting to cell k from cell k - 1
+        same_line = rs[1:] == rs[:-1]
+        gap = np.where(same_line, dis[1:] - dis[:-1] - 1, 0)
+        lines_down = np.where(same_line, 0, djs[1:] - djs[:-1])
+        previous_is = dis[:-1]
+        before_is = np.maximum(dis[1:] - 1, 0)
+
+        cost_fill = np.where(
+            same_line & (runs[rs[1:], before_is] == runs[rs[1:], previous_is]),
+            cum_lengths[rs[1:], before_is] - cum_lengths[rs[1:], previous_is],
+            np.iinfo(np.int32).max)
+        cost_relative = np.where(same_line,
+            forward_lengths[gap],
+            down_lengths[lines_down] + forward_lengths[dis[1:]])
+        cost_absolute = row_lengths[djs[1:]] + col_lengths[dis[1:]]
+
+        # 0 = fill (or no movement at all), 1 = relative, 2 = absolute; the first cell always jumps
+        choice = np.empty(n, dtype = np.int8)
+        choice[0] = 2
+        choice[1:] = np.argmin(np.vstack((cost_fill, cost_relative, cost_absolute)), axis = 0)
+
+        # cells between two dirty cells that get re-sent instead of moving the cursor
+        where_fill = np.flatnonzero((choice[1:] == 0) & (gap > 0))
+        fill_marks = np.zeros((where_diff.shape[0], where_diff.shape[1] + 1), dtype = np.int8)
+        fill_marks[rs[where_fill], previous_is[where_fill] + 1] = 1
+        fill_marks[rs[where_fill + 1], dis[where_fill + 1]] = -1
+        where_emit = where_diff | (np.cumsum(fill_marks, axis = 1)[:, :-1] > 0)
+
+        ers, eis = np.nonzero(where_emit)
+        m = ers.shape[0]
+
+        # one row per emitted cell: [cursor movement, cursor movement, color escape, glyph]
+        parts = np.empty((m, 4), dtype = object)
+        parts[:, :3] = b""
+
+        # position of each dirty cell among the emitted cells
+        k_emit = (np.cumsum(where_emit.ravel()) - 1)[rs * where_diff.shape[1] + dis]
+
+        where_absolute = choice == 2
+        parts[k_emit[where_absolute], 0] = row_strings[djs[where_absolute]]
+        parts[k_emit[where_absolute], 1] = col_strings[dis[where_absolute]]
+
+        where_relative = np.flatnonzero(choice[1:] == 1)
+        where_forward = where_relative[same_line[where_relative]]
+        where_down = where_relative[~same_line[where_relative]]
+        parts[k_emit[where_forward + 1], 0] = forward_strings[gap[where_forward]]
+        parts[k_emit[where_down + 1], 0] = down_strings[lines_down[where_down]]
+        parts[k_emit[where_down + 1], 1] = forward_strings[dis[where_down + 1]]
+
+        if self.color_support != COLOR_SUPPORT_1:
+            ekeys = keys[ers, eis]
+            where_color = np.empty(m, dtype = bool)
+            where_color[0] = ekeys[0] != self.last_color_key
+            where_color[1:] = ekeys[1:] != ekeys[:-1]
+            unique_keys, inverse = np.unique(ekeys[where_color], return_inverse = True)
+            escapes = np.array([self._color_escape(k) for k in unique_keys.tolist()], dtype = object)
+            parts[where_color, 2] = escapes[inverse]
+            self.last_color_key = int(ekeys[-1])
+
+        parts[:, 3] = glyphs[buffer[ers, eis]]
+
+        return b"".join(parts.ravel().tolist())
 
 if __name__ == '__main__':
     # perform a test if run directly
@@ -0,0 +1,28 @@
+class DecodeCache(object):
+    """
+    Remembers the result of decoding the latest message, so that the frames drawn until the
+    next message arrives don't decode it again. The result is keyed on the identity of the
+    message and on any parameters that change it, e.g. the terminal shape:
+
+        cache = DecodeCache(lambda msg, width, height: ...)
+        image = cache.get(msg, width, height)
+
+    The message is kept referenced while cached, so its identity can't be reused.
+    """
+    def __init__(self, decode):
+        self.decode = decode
+        self.msg = None
+        self.params = None
+        self.value = None
+
+    def get(self, msg, *params):
+        if msg is not self.msg or params != self.params:
+            self.value = self.decode(msg, *params)
+            self.msg = msg
+            self.params = params
+        return self.value
+
+    def clear(self):
+        self.msg = None
+        self.params = None
+        self.value = None
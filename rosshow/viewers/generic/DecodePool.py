@@ -0,0 +1,169 @@
+import numpy as np
+
+try:
+    import multiprocessing
+    from multiprocessing import shared_memory
+except ImportError: # python < 3.8
+    shared_memory = None
+
+def _run(function, meta, name, size, params):
+    """
+    Runs in a worker process: calls function(meta, data, *params) on the message bytes in
+    the shared memory block name, and copies the resulting array to a new shared memory
+    block. Returns the name of that block, the shape and dtype of the array in it, and the
+    state that function returned alongside the array (see DecodePool.cache()), if any.
+    """
+    # the decoders may return views of their input, which would keep the block from being
+    # closed, so they get a copy of the bytes
+    shm = shared_memory.SharedMemory(name = name)
+    try:
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    result = function(meta, data, *params)
+    state = None
+    if isinstance(result, tuple):
+        result, state = result
+    result = np.asarray(result)
+    out = shared_memory.SharedMemory(create = True, size = max(1, result.nbytes))
+    np.ndarray(result.shape, dtype = result.dtype, buffer = out.buf)[...] = result
+    out.close()
+    return out.name, result.shape, result.dtype.str, state
+
+def _as_bytes(data):
+    """
+    Returns the data field of a message as something that supports the buffer protocol.
+    """
+    if isinstance(data, (list, tuple)):
+        return bytearray(data)
+    return memoryview(data).cast("B")
+
+class DecodePool(object):
+    """
+    A pool of worker processes that decode messages off the interpreter running the ROS
+    callbacks, the key loop and the drawing loop, so that they don't contend for the GIL
+    and a second core gets used. Message bytes go to the workers and decoded arrays come
+    back through shared memory rather than being pickled through a pipe.
+
+    Viewers get a cache from the pool that is used like DecodeCache:
+
+        cache = pool.cache(decode_image, lambda msg: (None, msg.data))
+        image = cache.get(msg, width, height)
+
+    except that decode_image(meta, data, width, height) runs in a worker, so it must be a
+    module level function, and that get() returns the result for an older message (or
+    None) until the worker is done with the latest one.
+    """
+    def __init__(self, workers):
+        # workers are spawned rather than forked: forking a process with ROS threads running
+        # can leave them holding locks in the child
+        self.pool = multiprocessing.get_context("spawn").Pool(workers)
+        self.caches = []
+
+    @staticmethod
+    def available():
+        return shared_memory is not None
+
+    def cache(self, decode, payload, update = None):
+        """
+        Returns a PooledDecodeCache that runs decode in the pool. payload(msg) returns the
+        (meta, data) to decode msg from, where meta is anything that pickles and data are the
+        message bytes.
+
+        A decoder that keeps state across messages, which a worker can't, gets it in meta and
+        returns (array, new state) instead; update(new state) is then called in this process
+        when the result is collected. As only one message is in flight at a time, each decode
+        sees the state left by the previous one.
+        """
+        cache = PooledDecodeCache(self, decode, payload, update)
+        self.caches.append(cache)
+        return cache
+
+    def close(self):
+        # a decode is nearly always in flight; its shared memory has to be freed by us, as the
+        # workers are killed
+        for cache in self.caches:
+            cache.close()
+        self.pool.terminate()
+        self.pool.join()
+
+class PooledDecodeCache(object):
+    """
+    Decodes the latest message in a DecodePool. Only one message is in flight at a time and
+    messages that arrive meanwhile replace each other, so a slow decode drops the old work
+    instead of falling behind.
+    """
+    def __init__(self, pool, decode, payload, update = None):
+        self.pool = pool
+        self.decode = decode
+        self.payload = payload
+        self.update = update
+        self.msg = None
+        self.params = None
+        self.value = None
+        self.pending = None
+        self.job = None
+        self.shm = None
+
+    def get(self, msg, *params):
+        if msg is not self.msg or params != self.params:
+            self.msg = msg
+            self.params = params
+            self.pending = (msg, params)
+        self._collect()
+        if self.job is None and self.pending is not None:
+            self._submit(*self.pending)
+            self.pending = None
+        return self.value
+
+    def _submit(self, msg, params):
+        meta, data = self.payload(msg)
+        data = _as_bytes(data)
+        size = len(data)
+        self.shm = shared_memory.SharedMemory(create = True, size = max(1, size))
+        self.shm.buf[:size] = data
+        self.job = self.pool.pool.apply_async(_run, (self.decode, meta, self.shm.name, size, params))
+
+    def _collect(self):
+        if self.job is None or not self.job.ready():
+            return
+        job = self.job
+        self.job = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+        try:
+            name, shape, dtype, state = job.get()
+        except Exception:
+            # a message that fails to decode is dropped and the last good one stays up
+            return
+        out = shared_memory.SharedMemory(name = name)
+        try:
+            self.value = np.ndarray(shape, dtype = dtype, buffer = out.buf).copy()
+        finally:
+            out.close()
+            out.unlink()
+        if self.update is not None:
+            self.update(state)
+
+    def close(self, timeout = 5.):
+        """
+        Waits up to timeout seconds for the decode in flight, if any, and frees its shared
+        memory blocks.
+        """
+        if self.job is not None:
+            self.job.wait(timeout)
+            if self.job.ready():
+                self._collect()
+            else:
+                self.job = None
+                self.shm.close()
+                self.shm.unlink()
+                self.shm = None
+        self.clear()
+
+    def clear(self):
+        self.msg = None
+        self.params = None
+        self.value = None
+        self.pending = None
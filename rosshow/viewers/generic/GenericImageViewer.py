@@ -1,6 +1,7 @@
 import numpy as np
 import time
 import rosshow.termgraphics as termgraphics
+from rosshow.viewers.generic.DecodeCache import DecodeCache
 import sys
 
 try:
@@ -16,8 +17,74 @@ except ImportError:
     print("and try again.")
     exit(1)
 
+def fit_size(image_size, w, h):
+    """
+    Returns the size (width, height) in pixels to scale an image of image_size to so that
+    it fits a w x h canvas, at one pixel per 2 x 4 block of dots.
+    """
+    image_ratio = 0.5 * float(image_size[1]) / image_size[0] # height / width
+    terminal_ratio = 0.5 * float(h) / w  # height / width
+
+    if image_ratio > terminal_ratio:
+       target_image_height = int(h / 4.0)
+       target_image_width = int(target_image_height / image_ratio)
+    else:
+       target_image_width = int(w / 2.0)
+       target_image_height = int(image_ratio * target_image_width)
+
+    return target_image_width, target_image_height
+
+def fit_image(image_obj, w, h, size = None):
+    """
+    Scales the PIL image image_obj to fit a w x h canvas, or to size if given. Returns the
+    scaled image as a height x width x 3 numpy array.
+    """
+    target_image_width, target_image_height = size or fit_size(image_obj.size, w, h)
+
+    resized_image_obj = image_obj.resize((target_image_width, target_image_height), PIL.Image.BILINEAR)
+    resized_image = np.frombuffer(resized_image_obj.tobytes(), dtype = np.uint8).reshape(target_image_height, target_image_width, 3)
+
+    return resized_image
+
+# samples averaged per target pixel along each axis by fit_array
+SAMPLES = 2
+
+_sample_indices_cache = {}
+
+def sample_indices(source_size, target_size, samples = SAMPLES):
+    """
+    Returns a target_size x samples array of the source pixels to average for each target
+    pixel along one axis, evenly spread over the span of source pixels the target pixel
+    covers. Cached, as it only changes with the image or terminal size.
+    """
+    key = (source_size, target_size, samples)
+    if key not in _sample_indices_cache:
+        if len(_sample_indices_cache) > 16:
+            _sample_indices_cache.clear()
+        positions = np.arange(target_size)[:, np.newaxis] + (np.arange(samples) + 0.5) / samples
+        _sample_indices_cache[key] = (positions * source_size / target_size).astype(np.intp)
+    return _sample_indices_cache[key]
+
+def fit_array(image, w, h):
+    """
+    Scales the H x W x 3 array image to fit a w x h canvas. Returns the scaled image as a
+    height x width x 3 uint8 array.
+
+    Each target pixel is the mean of SAMPLES x SAMPLES source pixels picked with cached
+    indices, straight from image, which may be any strided view of a message buffer. The
+    cost only depends on the size of the target.
+    """
+    target_image_width, target_image_height = fit_size((image.shape[1], image.shape[0]), w, h)
+    rows = sample_indices(image.shape[0], target_image_height)
+    cols = sample_indices(image.shape[1], target_image_width)
+
+    # target_image_height x SAMPLES x target_image_width x SAMPLES x 3
+    samples = image[rows[:, :, np.newaxis, np.newaxis], cols[np.newaxis, np.newaxis, :, :]]
+    return samples.mean(axis = (1, 3)).astype(np.uint8)
+
 class GenericImageViewer(object):
-    def __init__(self, canvas, msg_decoder = None, title = ""):
+    def __init__(self, canvas, msg_decoder = None, title = "", sized_decoder = None, msg_payload = None, decode_pool = None,
+            sized_update = None):
         self.g = canvas
         self.xmax = 20
         self.ymax = 20
@@ -26,35 +93,42 @@ class GenericImageViewer(object):
         # Most recent ROS message
         self.msg = None
 
-        # Last time terminal shape was updated
-        self.last_update_shape_time = 0
-
         # Function that converts ROS message to a numpy RGB image OR PIL.Image to display (either is OK)
         self.msg_decoder = msg_decoder
 
+        # Decoded image and image scaled to the terminal, of the latest message
+        self.decode_cache = DecodeCache(self.decode)
+        self.resample_cache = DecodeCache(self.resample)
+
+        # Alternatively sized_decoder(meta, data, w, h) does both in one go, given the
+        # (meta, data) that msg_payload(msg) extracts from the message, which lets it skip
+        # decoding detail that would be scaled away. It runs in a worker process if there
+        # is a decode pool. If sized_update is given, sized_decoder keeps state across images:
+        # it gets the state through msg_payload and returns (image, new state), and
+        # sized_update(new state) is called here (see DecodePool.cache()).
+        self.sized = sized_decoder is not None
+        if self.sized and decode_pool is not None:
+            self.resample_cache = decode_pool.cache(sized_decoder, msg_payload, sized_update)
+        elif self.sized:
+            def sized_decode(msg, w, h):
+                image = sized_decoder(*(msg_payload(msg) + (w, h)))
+                if sized_update is not None:
+                    image, state = image
+                    sized_update(state)
+                return image
+            self.resample_cache = DecodeCache(sized_decode)
+
         # Display title
         self.title = title
 
     def update(self, msg):
         self.msg = msg
 
-    def draw(self):
-        if not self.msg:
-            return
-
-        t = time.time()
-
-        # capture changes in terminal shape at least every 0.25s
-        if t - self.last_update_shape_time > 0.25:
-            self.g.update_shape()
-            self.last_update_shape_time = t
-
-        self.g.clear()
-        w = self.g.shape[0]
-        h = self.g.shape[1]
-
-        image = self.msg_decoder(self.msg)
-
+    def decode(self, msg):
+        """
+        Decodes msg to an H x W x 3 array or an RGB PIL image.
+        """
+        image = self.msg_decoder(msg)
 
         if type(image) == np.ndarray: # we accept ndarray HxWx3 (RGB)
             if len(image.shape) != 3:
@@ -64,9 +138,9 @@ class GenericImageViewer(object):
                 print("GenericImageViewer error: expected shape (H,W,3)")
                 exit(1)
 
-            image_obj = PIL.Image.fromarray(image.astype(np.uint8))
+            image_obj = image
 
-        elif PIL.Image.isImageType(image): # we accept PIL.Image
+        elif isinstance(image, PIL.Image.Image): # we accept PIL.Image
             if image.mode != "RGB":
                 print("GenericImageViewer error: received non-RGB PIL image")
                 exit(1)
@@ -77,20 +151,38 @@ class GenericImageViewer(object):
             print("GenericImageViewer error: received invalid image type %s" % str(type(image)))
             exit(1)
 
-        image_ratio = 0.5 * float(image_obj.size[1]) / image_obj.size[0] # height / width
-        terminal_ratio = 0.5 * float(h) / w  # height / width
+        return image_obj
 
-        if image_ratio > terminal_ratio:
-           target_image_height = int(h / 4.0)
-           target_image_width = int(target_image_height / image_ratio)
-        else:
-           target_image_width = int(w / 2.0)
-           target_image_height = int(image_ratio * target_image_width)
+    def resample(self, msg, w, h):
+        """
+        Scales the image in msg to fit a w x h canvas.
+        """
+        image = self.decode_cache.get(msg)
+        if isinstance(image, np.ndarray):
+            return fit_array(image, w, h)
+        return fit_image(image, w, h)
+
+    def draw(self):
+        msg = self.msg
+        if not msg:
+            return
 
-        resized_image_obj = image_obj.resize((target_image_width, target_image_height), PIL.Image.BILINEAR)
-        resized_image = np.fromstring(resized_image_obj.tobytes(), dtype = np.uint8).reshape(target_image_width, target_image_height, 3)
+        self.g.clear()
+        w = self.g.shape[0]
+        h = self.g.shape[1]
+
+        # both only do work when a new message has arrived or the terminal was resized
+        if not self.sized:
+            with self.g.profiler.stage("decode"):
+                self.decode_cache.get(msg)
+        with self.g.profiler.stage("resample"):
+            resized_image = self.resample_cache.get(msg, w, h)
+        if resized_image is None: # the decode pool hasn't finished the first message yet
+            return
+        target_image_height, target_image_width = resized_image.shape[:2]
 
-        self.g.image(resized_image, target_image_width, target_image_height, (0, 0), image_type = termgraphics.IMAGE_RGB_2X4)
+        with self.g.profiler.stage("raster"):
+            self.g.image(resized_image, target_image_width, target_image_height, (0, 0), image_type = termgraphics.IMAGE_RGB_2X4)
 
         if self.title:
             self.g.set_color((0, 127, 255))
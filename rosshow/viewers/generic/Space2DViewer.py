@@ -2,6 +2,7 @@ import numpy as np
 import time
 
 import rosshow.termgraphics as termgraphics
+from rosshow.viewers.generic.DecodeCache import DecodeCache
 
 class Space2DViewer(object):
     """
@@ -28,12 +29,12 @@ class Space2DViewer(object):
         # Most recent ROS message
         self.msg = None
 
-        # Last time terminal shape was updated
-        self.last_update_shape_time = 0
-
         # Function that converts ROS message to Nx2 point array
         self.msg_decoder = msg_decoder
 
+        # Draw commands of the latest message
+        self.decode_cache = DecodeCache(msg_decoder)
+
         # Display title
         self.title = title
 
@@ -61,16 +62,10 @@ class Space2DViewer(object):
         self.msg = msg
 
     def draw(self):
-        if not self.msg:
+        msg = self.msg
+        if not msg:
             return
 
-        t = time.time()
-
-        # capture changes in terminal shape at least every 0.25s
-        if t - self.last_update_shape_time > 0.25:
-            self.canvas.update_shape()
-            self.last_update_shape_time = t
-
         # animation over 0.5s when zooming in/out
         if self.scale != self.target_scale \
                 or self.offset_x != self.target_offset_x \
@@ -94,24 +89,31 @@ class Space2DViewer(object):
         xmax = self.scale
         ymax = self.scale * h/w
 
-        for command_type, color, data in self.msg_decoder(self.msg):
+        profiler = self.canvas.profiler
+        # only decodes when a new message has arrived; panning and zooming just redo the projection
+        with profiler.stage("decode"):
+            draw_commands = self.decode_cache.get(msg)
+
+        for command_type, color, data in draw_commands:
             if command_type == Space2DViewer.COMMAND_TYPE_POINTS:
                 self.canvas.set_color(color)
-                x = data[:,0]
-                y = data[:,1]
+                with profiler.stage("project"):
+                    x = data[:,0]
+                    y = data[:,1]
 
-                screen_is = (w * (x - self.offset_x + xmax) / (2 * xmax)).astype(np.uint16)
-                screen_js = (h * (1 - (y - self.offset_y + ymax) / (2 * ymax))).astype(np.uint16)
+                    screen_is = (w * (x - self.offset_x + xmax) / (2 * xmax)).astype(np.uint16)
+                    screen_js = (h * (1 - (y - self.offset_y + ymax) / (2 * ymax))).astype(np.uint16)
 
-                where_valid = ~np.isnan(screen_is) & ~np.isnan(screen_js) & \
-                        (screen_is > 0) & (screen_js > 0) & \
-                        (screen_is < w) & (screen_js < h)
-                screen_is = screen_is[where_valid]
-                screen_js = screen_js[where_valid]
+                    where_valid = ~np.isnan(screen_is) & ~np.isnan(screen_js) & \
+                            (screen_is > 0) & (screen_js > 0) & \
+                            (screen_is < w) & (screen_js < h)
+                    screen_is = screen_is[where_valid]
+                    screen_js = screen_js[where_valid]
 
-                screen_points = np.vstack((screen_is, screen_js)).T
+                    screen_points = np.vstack((screen_is, screen_js)).T
 
-                self.canvas.points(screen_points)
+                with profiler.stage("raster"):
+                    self.canvas.points(screen_points)
 
             elif command_type == Space2DViewer.COMMAND_TYPE_LINE:
                 self.canvas.set_color(color)
@@ -1,35 +1,232 @@
+import math
 import numpy as np
 import time
-import PIL.Image
 import rosshow.termgraphics as termgraphics
 
-from rosshow.viewers.generic.GenericImageViewer import GenericImageViewer
+from rosshow.viewers.generic.DecodeCache import DecodeCache
 
-class OccupancyGridViewer(GenericImageViewer):
+def _occupancy_colors():
+    """
+    Returns the 256 x 4 table of colors for the occupancy values, indexed by the values as
+    uint8 (i.e. -1 is 255). The 4th byte is padding, so that the table can be looked up with
+    one 32-bit gather per cell, which numpy does a lot faster than gathering rows of 3 bytes:
+    Values <0 are shown in yellow
+    Values >100 are shown in red
+    0-100 are probabilities and shown as white to black
+    """
+    values = np.arange(256).astype(np.uint8).view(np.int8).astype(np.int16)
+    colors = np.zeros((256, 4), dtype = np.uint8)
+    colors[:, :3] = ((100 - np.clip(values, 0, 100)) * 10 // 4)[:, np.newaxis] # *10//4 is int approx to *255.0/100.0
+    colors[values < 0, :3] = [255, 127, 0]
+    colors[values > 100, :3] = [255, 0, 0]
+    return colors
+
+OCCUPANCY_COLORS = _occupancy_colors()
+OCCUPANCY_COLORS_32 = OCCUPANCY_COLORS.view(np.uint32)[:, 0]
+
+# value of the cells of the pyramid that are off the map: lower than any other, so that
+# max pooling ignores them, and shown in black
+OFF_MAP = -128
+
+def _occupancy_data(data):
+    """
+    Returns the int8[] data of an OccupancyGrid or OccupancyGridUpdate as an int8 array,
+    without a copy if it supports the buffer protocol (e.g. array.array in ros2).
+    """
+    try:
+        return np.frombuffer(data, dtype = np.int8)
+    except (TypeError, ValueError): # list or tuple
+        return np.asarray(data, dtype = np.int8)
+
+def max_pool(grid):
+    """
+    Returns the maximum of each 2 x 2 block of grid. The values are ordered unknown (-1) <
+    free (0) < occupied (1-100), so obstacles survive any number of levels of pooling.
+    """
+    height, width = grid.shape
+    if height % 2 or width % 2:
+        padded = np.full((height + height % 2, width + width % 2), OFF_MAP, dtype = np.int8)
+        padded[:height, :width] = grid
+        grid = padded
+    return np.maximum(np.maximum(grid[0::2, 0::2], grid[0::2, 1::2]), np.maximum(grid[1::2, 0::2], grid[1::2, 1::2]))
+
+def build_pyramid(grid):
+    """
+    Returns [grid, max_pool(grid), max_pool(max_pool(grid)), ...] down to a single cell.
+    """
+    pyramid = [grid]
+    while pyramid[-1].shape[0] > 1 or pyramid[-1].shape[1] > 1:
+        pyramid.append(max_pool(pyramid[-1]))
+    return pyramid
+
+def patch_pyramid(pyramid, x0, y0, x1, y1):
+    """
+    Recomputes the cells of the pooled levels of pyramid that cover the rectangle
+    [x0, x1) x [y0, y1) of its first level.
+    """
+    for level in range(1, len(pyramid)):
+        x0, y0, x1, y1 = x0 // 2, y0 // 2, (x1 + 1) // 2, (y1 + 1) // 2
+        pyramid[level][y0:y1, x0:x1] = max_pool(pyramid[level - 1][2 * y0:2 * y1, 2 * x0:2 * x1])
+
+class OccupancyGridViewer(object):
+    """
+    Shows a nav_msgs/OccupancyGrid, with pan and zoom. Each map is max-pooled into a pyramid
+    of levels of half the resolution of the previous one, and each frame samples the level
+    that is just finer than a character, so drawing costs the same at any zoom and for any
+    size of map, and thin obstacles don't disappear when zoomed out.
+    """
     def __init__(self, canvas, title = ""):
-        def msg_decoder(msg):
-            """
-            Decodes a nav_msgs/OccupancyGrid ROS message into a numpy H x W x 3 RGB visualization.
-            Values <0 are shown in yellow
-            Values >100 are shown in red
-            0-100 are probabilities and shown as white to black
-            """
+        self.g = canvas
+        self.title = title
+
+        # Most recent ROS message
+        self.msg = None
+
+        # Pyramid of the latest map
+        self.decode_cache = DecodeCache(self.decode)
+
+        # (map, map_msgs/OccupancyGridUpdate) received since the last frame, with the map they
+        # came after
+        self.updates = []
+
+        # View: map cell at the center of the screen and map cells per character horizontally
+        # (characters are about twice as tall as wide, so twice that vertically). Set to show
+        # the whole map when the first map arrives.
+        self.center = None
+        self.scale = None
+        self.map_size = None
+
+    def update(self, msg):
+        self.msg = msg
+
+    def subscriptions(self, topic):
+        """
+        Companion topics to subscribe to, as (topic, type, callback): costmaps are published
+        in full once and then as updates of the rectangles that changed.
+        """
+        return [(topic + "_updates", "map_msgs/OccupancyGridUpdate", self.update_part)]
+
+    def update_part(self, update):
+        msg = self.msg
+        if msg is not None:
+            self.updates.append((msg, update))
+
+    def keypress(self, c):
+        if self.scale is None:
+            return
+        pan = self.scale * self.g.term_shape[0] / 10.
+        if c == "+" or c == "=":
+            self.scale = max(self.scale / 1.5, 1. / 8)
+        elif c == "-":
+            self.scale = min(self.scale * 1.5, 2 * self.fit_scale())
+        elif c == "0":
+            self.fit()
+        elif c == "up":
+            self.center = (self.center[0], self.center[1] + pan)
+        elif c == "down":
+            self.center = (self.center[0], self.center[1] - pan)
+        elif c == "left":
+            self.center = (self.center[0] + pan, self.center[1])
+        elif c == "right":
+            self.center = (self.center[0] - pan, self.center[1])
+
+    def decode(self, msg):
+        """
+        Returns the pyramid of the occupancy grid in msg, with rows from the bottom (y = 0) up.
+        """
+        grid = _occupancy_data(msg.data).reshape(msg.info.height, msg.info.width)
+        return build_pyramid(grid.copy()) # copied, as updates are painted into it
+
+    def patch(self, pyramid, msg):
+        """
+        Paints the rectangles of the updates received since the last frame into pyramid, the
+        pyramid of map msg. Updates received before the first map are dropped, and so are
+        updates to an older map than msg, which msg already supersedes. Updates to a newer
+        map than msg, which has arrived meanwhile, are kept for the next frame.
+        """
+        updates, self.updates = self.updates, []
+        newer = [(update_msg, update) for update_msg, update in updates if update_msg is not msg and update_msg is self.msg]
+        if newer:
+            self.updates[:0] = newer
+        grid = pyramid[0]
+
+        for update_msg, update in updates:
+            if update_msg is not msg:
+                continue
+            x0 = max(0, update.x)
+            y0 = max(0, update.y)
+            x1 = min(grid.shape[1], update.x + update.width)
+            y1 = min(grid.shape[0], update.y + update.height)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            occupancy = _occupancy_data(update.data).reshape(update.height, update.width)
+            grid[y0:y1, x0:x1] = occupancy[y0 - update.y:y1 - update.y, x0 - update.x:x1 - update.x]
+            patch_pyramid(pyramid, x0, y0, x1, y1)
+
+    def fit_scale(self):
+        width, height = self.map_size
+        return max(float(width) / self.g.term_shape[0], float(height) / (2 * self.g.term_shape[1]), 1. / 8)
+
+    def fit(self):
+        width, height = self.map_size
+        self.center = (width / 2., height / 2.)
+        self.scale = self.fit_scale()
+
+    def sample(self, pyramid):
+        """
+        Returns the colors of the characters of the screen, as a rows x columns x 3 array.
+        Each character is the maximum of the cells it covers of the level of pyramid just
+        finer than it, of which there are at most 2 horizontally and 4 vertically.
+        """
+        columns, rows = self.g.term_shape
+        level = int(min(max(0, math.floor(math.log(self.scale, 2))), len(pyramid) - 1))
+        grid = pyramid[level]
+        cell = 2. ** level
+
+        # cells of the level at samples spread evenly over each character
+        samples_x = int(math.ceil(self.scale / cell))
+        samples_y = int(math.ceil(2 * self.scale / cell))
+        xs = self.center[0] + (np.arange(columns)[:, np.newaxis] - columns / 2. + (np.arange(samples_x) + 0.5) / samples_x) * self.scale
+        ys = self.center[1] + (rows / 2. - np.arange(rows)[:, np.newaxis] - (np.arange(samples_y) + 0.5) / samples_y) * 2 * self.scale
+        xs = np.floor(xs / cell).astype(np.intp)
+        ys = np.floor(ys / cell).astype(np.intp)
+        inside = ((ys >= 0) & (ys < grid.shape[0]))[:, :, np.newaxis, np.newaxis] & \
+            ((xs >= 0) & (xs < grid.shape[1]))[np.newaxis, np.newaxis, :, :]
+
+        # rows x samples_y x columns x samples_x
+        values = grid[np.clip(ys, 0, grid.shape[0] - 1)[:, :, np.newaxis, np.newaxis], np.clip(xs, 0, grid.shape[1] - 1)[np.newaxis, np.newaxis, :, :]]
+        values = np.where(inside, values, np.int8(OFF_MAP)).max(axis = (1, 3))
 
-            occupancy_map = np.array(self.msg.data, dtype=np.int16).reshape(self.msg.info.height, self.msg.info.width)[::-1, :]
+        colors = OCCUPANCY_COLORS_32[values.view(np.uint8)][:, :, np.newaxis].view(np.uint8)[:, :, :3]
+        colors[values == OFF_MAP] = 0
+        return colors
 
-            color_prob_zero = np.array([0, 0, 0], dtype=np.uint8)
-            color_prob_one = np.array([255, 255, 255], dtype=np.uint8)
+    def draw(self):
+        msg = self.msg
+        if not msg:
+            return
 
-            map_image = ((100 - occupancy_map) * 10 // 4).astype(np.uint8) # *10//4 is int approx to *255.0/100.0
-            map_image = np.stack((map_image,)*3, axis = -1) # greyscale to rgb
+        # only decodes when a new map has arrived, and only patches what updates changed
+        with self.g.profiler.stage("decode"):
+            pyramid = self.decode_cache.get(msg)
+            self.patch(pyramid, msg)
 
-            # display <0 in yellow
-            map_image[occupancy_map < 0] = [255, 127, 0]
+        # a map of a new size is shown whole; otherwise the view is kept
+        if self.map_size != (msg.info.width, msg.info.height):
+            self.map_size = (msg.info.width, msg.info.height)
+            self.fit()
 
-            # display >100 in red
-            map_image[occupancy_map > 100] = [255, 0, 0]
+        self.g.clear()
+        with self.g.profiler.stage("resample"):
+            colors = self.sample(pyramid)
+        with self.g.profiler.stage("raster"):
+            self.g.image(colors, colors.shape[1], colors.shape[0], (0, 0), image_type = termgraphics.IMAGE_RGB_2X4)
 
-            return map_image
+        if self.title:
+            self.g.set_color((0, 127, 255))
+            self.g.text(self.title, (0, self.g.shape[1] - 4))
 
-        GenericImageViewer.__init__(self, canvas, msg_decoder = msg_decoder, title = title)
+        self.g.set_color((127, 127, 127))
+        self.g.text("up/down/left/right: pan   +/-: zoom   0: fit", (int(self.g.shape[0]/3), self.g.shape[1] - 4))
 
+        self.g.draw()
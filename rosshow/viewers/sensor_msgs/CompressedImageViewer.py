@@ -3,7 +3,7 @@ import numpy as np
 import sys
 
 import rosshow.termgraphics as termgraphics
-from rosshow.viewers.generic.GenericImageViewer import GenericImageViewer
+from rosshow.viewers.generic.GenericImageViewer import GenericImageViewer, fit_image, fit_size
 
 try:
     import PIL.Image
@@ -18,20 +18,22 @@ except ImportError:
     print("and try again.")
     exit(1)
 
-class CompressedImageViewer(GenericImageViewer):
-    def __init__(self, canvas, title = ""):
-        def msg_decoder(msg):
-            """
-            Decodes a sensor_msgs/CompressedImage ROS message into a numpy H x W x 3 RGB image.
-            Using PIL to decode compressed images because ROS's cv2 doesn't have python3 bindings.
-            TODO: Make a version that can gracefully use either PIL.Image.open() or cv2.imdecode() depending
-            on what is available.
-            """
-
-            image_obj = PIL.Image.open(io.BytesIO(self.msg.data))
-            if image_obj.mode != "RGB":
-                image_obj = image_obj.convert("RGB")
-            return image_obj
-
-        GenericImageViewer.__init__(self, canvas, msg_decoder = msg_decoder, title = title)
+def decode_compressed_image(meta, data, w, h):
+    """
+    Decodes the bytes of a sensor_msgs/CompressedImage and scales the image to fit a w x h
+    canvas. JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg if that is still at
+    least the size the image is scaled to, which for a camera image on a terminal is
+    usually 1/8, and skips most of the decoding.
+    Using PIL to decode compressed images because ROS's cv2 doesn't have python3 bindings.
+    """
+    image_obj = PIL.Image.open(io.BytesIO(data))
+    size = fit_size(image_obj.size, w, h)
+    image_obj.draft("RGB", (max(1, size[0]), max(1, size[1])))
+    if image_obj.mode != "RGB":
+        image_obj = image_obj.convert("RGB")
+    return fit_image(image_obj, w, h, size = size)
 
+class CompressedImageViewer(GenericImageViewer):
+    def __init__(self, canvas, title = "", decode_pool = None):
+        GenericImageViewer.__init__(self, canvas, title = title, sized_decoder = decode_compressed_image,
+            msg_payload = lambda msg: (None, msg.data), decode_pool = decode_pool)
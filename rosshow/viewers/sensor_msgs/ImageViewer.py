@@ -1,38 +1,206 @@
+import functools
 import numpy as np
 
 import rosshow.termgraphics as termgraphics
-from rosshow.viewers.generic.GenericImageViewer import GenericImageViewer
+from rosshow.viewers.generic.GenericImageViewer import GenericImageViewer, fit_size, fit_array, SAMPLES
+
+# about this many pixels of a 16-bit or float image are sampled to find its 5th and 95th percentiles
+PERCENTILE_SAMPLES = 65536
+
+# weight of the newest image in the running average of the percentiles
+PERCENTILE_SMOOTHING = 0.2
+
+def _pixels(rows, width, channels, dtype = np.uint8, bigendian = False):
+    """
+    Returns the height x width x channels view of the raw rows of an image, leaving out any
+    padding at the end of the rows. The view is built from strides rather than with .view()
+    on a slice of rows, which numpy < 1.23 refuses for padded rows and itemsizes > 1.
+    """
+    dtype = np.dtype(dtype).newbyteorder(">" if bigendian else "<")
+    return np.ndarray((rows.shape[0], width, channels), dtype = dtype, buffer = rows,
+        strides = (rows.strides[0], channels * dtype.itemsize, dtype.itemsize))
+
+def decode_rgb(rows, width, step, ranges, bigendian, channels = 3, order = slice(0, 3)):
+    """
+    rgb8, bgr8, rgba8 and bgra8: every step-th pixel, with the channels sliced to RGB.
+    """
+    return _pixels(rows, width, channels)[::step, ::step, order]
+
+def decode_mono8(rows, width, step, ranges, bigendian):
+    image = _pixels(rows, width, 1)[::step, ::step]
+    return np.broadcast_to(image, image.shape[:2] + (3,)) # greyscale to RGB
+
+def decode_mono16(rows, width, step, ranges, bigendian):
+    """
+    mono16 and 16UC1, with the 5th to 95th percentile stretched to black to white.
+    """
+    image = _pixels(rows, width, 1, np.uint16, bigendian)[::step, ::step, 0]
+    image = mono16_lut(image, ranges)[image]
+    return np.broadcast_to(image[:, :, np.newaxis], image.shape + (3,)) # greyscale to RGB
+
+# positions of red and blue in the 2 x 2 quads of each bayer pattern; the other two are green
+BAYER_PATTERNS = {
+    "rggb": ((0, 0), (1, 1)),
+    "bggr": ((1, 1), (0, 0)),
+    "gbrg": ((1, 0), (0, 1)),
+    "grbg": ((0, 1), (1, 0)),
+}
+
+def decode_bayer(rows, width, step, ranges, bigendian, pattern = "rggb"):
+    """
+    bayer_*8: each 2 x 2 quad of the mosaic becomes one RGB pixel, and only every step/2-th
+    quad is read, instead of debayering the whole image.
+    """
+    (ri, rj), (bi, bj) = BAYER_PATTERNS[pattern]
+    quad_step = 2 * max(1, step // 2)
+    mosaic = _pixels(rows, width, 1)[:, :, 0]
+    height, width = mosaic.shape[0] // 2 * 2, mosaic.shape[1] // 2 * 2
+    red = mosaic[ri:height:quad_step, rj:width:quad_step]
+    green0 = mosaic[ri:height:quad_step, 1 - rj:width:quad_step]
+    green1 = mosaic[bi:height:quad_step, 1 - bj:width:quad_step]
+    blue = mosaic[bi:height:quad_step, bj:width:quad_step]
+
+    image = np.empty(red.shape + (3,), dtype = np.uint8)
+    image[:, :, 0] = red
+    image[:, :, 1] = (green0.astype(np.uint16) + green1) >> 1
+    image[:, :, 2] = blue
+    return image
+
+def decode_yuv422(rows, width, step, ranges, bigendian, order = "uyvy"):
+    """
+    yuv422/uyvy (U Y0 V Y1) and yuyv (Y0 U Y1 V): each macropixel of two pixels becomes one
+    RGB pixel, reading every second row to keep the aspect ratio, and only every step/2-th
+    macropixel is converted.
+    """
+    pair_step = max(1, step // 2)
+    macropixels = _pixels(rows, width // 2, 4)[::2 * pair_step, ::pair_step]
+    if order == "uyvy":
+        u, y0, v, y1 = (macropixels[:, :, k].astype(np.float32) for k in range(4))
+    else:
+        y0, u, y1, v = (macropixels[:, :, k].astype(np.float32) for k in range(4))
+    y = (y0 + y1) * 0.5
+    u -= 128
+    v -= 128
+
+    # ITU-R BT.601
+    image = np.empty(y.shape + (3,), dtype = np.float32)
+    image[:, :, 0] = y + 1.402 * v
+    image[:, :, 1] = y - 0.344 * u - 0.714 * v
+    image[:, :, 2] = y + 1.772 * u
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def _colormap():
+    """
+    Returns a 257 x 3 table of colors from blue (near) through green and yellow to red (far),
+    plus black for invalid values at index 256.
+    """
+    x = np.linspace(0., 1., 256)
+    colors = np.empty((257, 3), dtype = np.uint8)
+    colors[:256, 0] = np.clip(255 * (1.5 - np.abs(4 * x - 3)), 0, 255)
+    colors[:256, 1] = np.clip(255 * (1.5 - np.abs(4 * x - 2)), 0, 255)
+    colors[:256, 2] = np.clip(255 * (1.5 - np.abs(4 * x - 1)), 0, 255)
+    colors[256] = 0
+    return colors
+
+COLORMAP = _colormap()
+
+def decode_32fc1(rows, width, step, ranges, bigendian):
+    """
+    32FC1, e.g. depth in meters, colormapped from its 5th to its 95th percentile. NaNs and
+    infinities are shown in black.
+    """
+    image = _pixels(rows, width, 1, np.float32, bigendian)[::step, ::step, 0]
+    valid = np.isfinite(image)
+    if valid.any():
+        image_min, image_max = smooth_range(ranges, "32FC1", np.percentile(image[valid], (5, 95)))
+    else:
+        image_min, image_max = 0., 1.
+    index = np.full(image.shape, 256, dtype = np.intp)
+    index[valid] = np.clip(255 * (image[valid] - image_min) / max(image_max - image_min, 1e-6), 0, 255)
+    return COLORMAP[index]
+
+def mono16_lut(image, ranges):
+    """
+    Returns a table that maps the 16-bit values of image to 0-255, stretching its 5th to
+    95th percentile to the full range. The percentiles are estimated from a histogram of
+    a strided subsample of image and averaged over time, so the brightness doesn't flicker.
+    """
+    step = max(1, int((image.size / float(PERCENTILE_SAMPLES)) ** 0.5))
+    cumulative = np.cumsum(np.bincount(image[::step, ::step].ravel(), minlength = 65536))
+    image_min, image_max = smooth_range(ranges, "mono16",
+        np.searchsorted(cumulative, (0.05 * cumulative[-1], 0.95 * cumulative[-1])))
+
+    lut = 255 * (np.arange(65536, dtype = np.float32) - image_min) / max(image_max - image_min, 1.)
+    return np.clip(lut, 0, 255).astype(np.uint8)
+
+def smooth_range(ranges, key, new_range):
+    """
+    Averages the (min, max) new_range into ranges[key] over time and returns the result.
+    """
+    if key not in ranges:
+        ranges[key] = (float(new_range[0]), float(new_range[1]))
+    else:
+        ranges[key] = tuple((1 - PERCENTILE_SMOOTHING) * old + PERCENTILE_SMOOTHING * new
+            for old, new in zip(ranges[key], new_range))
+    return ranges[key]
+
+# Decoders of sensor_msgs/Image encodings. Each gets the raw rows of the image as a height x
+# step-in-bytes uint8 array, the width in pixels, the stride to sample pixels at, a dict to
+# keep state across images in and whether multi-byte values are big-endian, and returns an
+# H x W x 3 image at about 1/stride of the resolution, read straight from the message buffer
+# wherever possible.
+ENCODINGS = {
+    "rgb8": decode_rgb,
+    "bgr8": functools.partial(decode_rgb, order = slice(2, None, -1)),
+    "rgba8": functools.partial(decode_rgb, channels = 4),
+    "bgra8": functools.partial(decode_rgb, channels = 4, order = slice(2, None, -1)),
+    "mono8": decode_mono8,
+    "8UC1": decode_mono8,
+    "mono16": decode_mono16,
+    "16UC1": decode_mono16,
+    "bayer_rggb8": functools.partial(decode_bayer, pattern = "rggb"),
+    "bayer_bggr8": functools.partial(decode_bayer, pattern = "bggr"),
+    "bayer_gbrg8": functools.partial(decode_bayer, pattern = "gbrg"),
+    "bayer_grbg8": functools.partial(decode_bayer, pattern = "grbg"),
+    "yuv422": functools.partial(decode_yuv422, order = "uyvy"),
+    "uyvy": functools.partial(decode_yuv422, order = "uyvy"),
+    "yuyv": functools.partial(decode_yuv422, order = "yuyv"),
+    "yuv422_yuy2": functools.partial(decode_yuv422, order = "yuyv"),
+    "32FC1": decode_32fc1,
+}
+
+def decode_image(meta, data, w, h):
+    """
+    Decodes a sensor_msgs/Image ROS message into a numpy RGB image that fits a w x h canvas.
+    This basically reproduces what cv_bridge does (except to RGB instead of BGR),
+    but cv_bridge doesn't support python3 :-/
+    Only the pixels that are shown are read: the image is sampled at a stride that still
+    leaves SAMPLES pixels to average per pixel shown.
+    meta ends with the smoothed percentiles of the previous images, which may run in a
+    decode worker, so the updated ones are returned along with the image.
+    """
+    encoding, height, width, step, bigendian, ranges = meta
+
+    target_image_width, target_image_height = fit_size((width, height), w, h)
+    stride = max(1, min(width // max(1, target_image_width * SAMPLES), height // max(1, target_image_height * SAMPLES)))
+
+    rows = np.frombuffer(data, np.uint8)[:height * step].reshape(height, step)
+    image = ENCODINGS[encoding](rows, width, stride, ranges, bigendian)
+    return fit_array(image, w, h), ranges
 
 class ImageViewer(GenericImageViewer):
-    def __init__(self, canvas, title = ""):
-        def msg_decoder(msg):
-            """
-            Decodes a sensor_msgs/Image ROS message into a numpy H x W x 3 RGB image.
-            This basically reproduces what cv_bridge does (except to RGB instead of BGR),
-            but cv_bridge doesn't support python3 :-/
-            """
-
-            if msg.encoding == 'bgr8':
-                image = np.frombuffer(msg.data, np.uint8).reshape((msg.height, msg.width, 3))[:, :, ::-1]
-            elif msg.encoding == 'bgra8':
-                image = np.frombuffer(msg.data, np.uint8).reshape((msg.height, msg.width, 4))[:, :, ::-1][:,:,1:]
-            elif msg.encoding == 'rgb8':
-                image = np.frombuffer(msg.data, np.uint8).reshape((msg.height, msg.width, 3))
-            elif msg.encoding == 'mono8' or msg.encoding == '8UC1':
-                image = np.frombuffer(msg.data, np.uint8).reshape((msg.height, msg.width))
-                image = np.stack((image,) * 3, axis = -1) # greyscale to RGB
-            elif msg.encoding == 'mono16' or msg.encoding == '16UC1':
-                image = np.frombuffer(msg.data, np.uint16).reshape((msg.height, msg.width)).astype(np.float)
-                image_max = np.percentile(image, 95)
-                image_min = np.percentile(image, 5)
-                image = 255*((image - image_min)/(image_max - image_min))
-                image = np.clip(image, 0, 255)
-                image = np.stack((image,) * 3, axis = -1) # greyscale to RGB
-            else:
-                print("Image encoding " + msg.encoding + " not supported yet.")
-                return None
-
-            return image
-
-        GenericImageViewer.__init__(self, canvas, msg_decoder = msg_decoder, title = title)
+    def __init__(self, canvas, title = "", decode_pool = None):
+        # smoothed percentiles of the 16-bit and float images, mapped to the ends of their scales
+        self.ranges = {}
+
+        GenericImageViewer.__init__(self, canvas, title = title, sized_decoder = decode_image, msg_payload = self.msg_payload,
+            decode_pool = decode_pool, sized_update = self.set_ranges)
+
+    def msg_payload(self, msg):
+        if msg.encoding not in ENCODINGS:
+            print("Image encoding " + msg.encoding + " not supported yet.")
+            exit(1)
+        return (msg.encoding, msg.height, msg.width, msg.step, bool(msg.is_bigendian), dict(self.ranges)), msg.data
 
+    def set_ranges(self, ranges):
+        self.ranges = ranges
@@ -1,157 +1,168 @@
-import time
 import math
+import threading
+import numpy as np
 import rosshow.termgraphics as termgraphics
 from rosshow.plotters import ScopePlotter, AnglePlotter
 
 class ImuViewer(object):
-    def __init__(self, canvas, title = ""):
+    def __init__(self, canvas, title = "", history = 128):
         self.g = canvas
-        self.last_update_shape_time = 0
         self.title = title
         self.right = 10
-        self.yaws = [ 0. ] * 128
-        self.yaws_p = 0
-        self.pitches = [ 0. ] * 128
-        self.pitches_p = 0
-        self.rolls = [ 0. ] * 128
-        self.rolls_p = 0
 
-        hmargin = self.g.shape[0]/40.
-        vmargin = self.g.shape[1]/20.
-        hsize = (self.g.shape[0] - 4*hmargin ) / 3
-        vsize = (self.g.shape[1] - 4*vmargin ) / 3
+        # raw orientation quaternion (x, y, z, w), angular velocity (x, y, z) and linear
+        # acceleration (x, y, z) of the messages received since the last draw, in a ring of
+        # the last history messages. The callback only copies them in; draw() converts the
+        # whole batch to euler angles at once.
+        self.pending = np.zeros((history, 10), dtype = np.float64)
+        self.pending_count = 0
+        self.pending_lock = threading.Lock()
 
         self.yaw_scope_plotter = ScopePlotter(self.g,
-            left = hmargin,
-            top = vmargin,
-            right = hmargin + hsize,
-            bottom = vmargin + vsize,
             ymin = -math.pi,
             ymax = math.pi,
+            n = history,
             title = "yaw",
         )
 
         self.pitch_scope_plotter = ScopePlotter(self.g,
-            left = hmargin,
-            top = 2*vmargin + vsize,
-            right = hmargin + hsize,
-            bottom = 2*vmargin + 2*vsize,
             ymin = -math.pi/2,
             ymax = math.pi/2,
+            n = history,
             title = "pitch",
         )
 
         self.roll_scope_plotter = ScopePlotter(self.g,
-            left = hmargin,
-            top = 3*vmargin + 2*vsize,
-            right = hmargin + hsize,
-            bottom = 3*vmargin + 3*vsize,
             ymin = -math.pi,
             ymax = math.pi,
+            n = history,
             title = "roll",
         )
 
         self.avx_scope_plotter = ScopePlotter(self.g,
-            left = 2*hmargin + hsize,
-            top = vmargin,
-            right = 2*hmargin + 2*hsize,
-            bottom = vmargin + vsize,
             ymin = -math.pi,
             ymax = math.pi,
+            n = history,
             title = "ang vel x",
         )
 
         self.avy_scope_plotter = ScopePlotter(self.g,
-            left = 2*hmargin + hsize,
-            top = 2*vmargin + vsize,
-            right = 2*hmargin + 2*hsize,
-            bottom = 2*vmargin + 2*vsize,
             ymin = -math.pi,
             ymax = math.pi,
+            n = history,
             title = "ang vel y",
         )
 
         self.avz_scope_plotter = ScopePlotter(self.g,
-            left = 2*hmargin + hsize,
-            top = 3*vmargin + 2*vsize,
-            right = 2*hmargin + 2*hsize,
-            bottom = 3*vmargin + 3*vsize,
             ymin = -math.pi,
             ymax = math.pi,
+            n = history,
             title = "ang vel z",
         )
 
         self.lax_scope_plotter = ScopePlotter(self.g,
-            left = 3*hmargin + 2*hsize,
-            top = vmargin,
-            right = 3*hmargin + 3*hsize,
-            bottom = vmargin + vsize,
             ymin = -9.8,
             ymax = 9.8,
+            n = history,
             title = "lin acc x",
         )
 
         self.lay_scope_plotter = ScopePlotter(self.g,
-            left = 3*hmargin + 2*hsize,
-            top = 2*vmargin + vsize,
-            right = 3*hmargin + 3*hsize,
-            bottom = 2*vmargin + 2*vsize,
             ymin = -9.8,
             ymax = 9.8,
+            n = history,
             title = "lin acc y",
         )
 
         self.laz_scope_plotter = ScopePlotter(self.g,
-            left = 3*hmargin + 2*hsize,
-            top = 3*vmargin + 2*vsize,
-            right = 3*hmargin + 3*hsize,
-            bottom = 3*vmargin + 3*vsize,
             ymin = -9.8,
             ymax = 9.8,
+            n = history,
             title = "lin acc z",
         )
 
+        self.resize()
+
+    def resize(self):
+        hmargin = self.g.shape[0]/40.
+        vmargin = self.g.shape[1]/20.
+        hsize = (self.g.shape[0] - 4*hmargin ) / 3
+        vsize = (self.g.shape[1] - 4*vmargin ) / 3
+
+        columns = (
+            (self.yaw_scope_plotter, self.pitch_scope_plotter, self.roll_scope_plotter),
+            (self.avx_scope_plotter, self.avy_scope_plotter, self.avz_scope_plotter),
+            (self.lax_scope_plotter, self.lay_scope_plotter, self.laz_scope_plotter),
+        )
+        for column, scope_plotters in enumerate(columns):
+            for row, scope_plotter in enumerate(scope_plotters):
+                scope_plotter.left = (column + 1)*hmargin + column*hsize
+                scope_plotter.top = (row + 1)*vmargin + row*vsize
+                scope_plotter.right = (column + 1)*hmargin + (column + 1)*hsize
+                scope_plotter.bottom = (row + 1)*vmargin + (row + 1)*vsize
+
     def keypress(self, c):
         return
 
     def update(self, data):
-        # quaternion to euler
-        norm = (data.orientation.x ** 2 + data.orientation.y ** 2 + data.orientation.z ** 2 + data.orientation.w ** 2) ** 0.5
-
-        if norm != 0.:
-            a = data.orientation.x / norm
-            b = data.orientation.y / norm
-            c = data.orientation.z / norm
-            d = data.orientation.w / norm
-
-            yaw = math.atan2(2*a*b+2*c*d, 1-2*b*b-2*c*c)
-            pitch = math.asin(2*(a*c-b*d))
-            roll = math.atan2(2*a*d+2*b*c, 1-2*c*c-2*d*d)+math.pi
-            if roll > math.pi:
-                roll -= 2*math.pi
-        else:
-            yaw = 0.
-            pitch = 0.
-            roll = 0.
-
-        self.yaw_scope_plotter.update(yaw)
-        self.pitch_scope_plotter.update(pitch)
-        self.roll_scope_plotter.update(roll)
-        self.avx_scope_plotter.update(data.angular_velocity.x)
-        self.avy_scope_plotter.update(data.angular_velocity.y)
-        self.avz_scope_plotter.update(data.angular_velocity.z)
-        self.lax_scope_plotter.update(data.linear_acceleration.x)
-        self.lay_scope_plotter.update(data.linear_acceleration.y)
-        self.laz_scope_plotter.update(data.linear_acceleration.z)
+        q = data.orientation
+        av = data.angular_velocity
+        la = data.linear_acceleration
+        with self.pending_lock:
+            self.pending[self.pending_count % self.pending.shape[0]] = \
+                (q.x, q.y, q.z, q.w, av.x, av.y, av.z, la.x, la.y, la.z)
+            self.pending_count += 1
+
+    def take_pending(self):
+        """
+        Returns the messages received since the last call as rows of the ring, oldest first.
+        """
+        with self.pending_lock:
+            count = self.pending_count
+            self.pending_count = 0
+            n = self.pending.shape[0]
+            if count <= n:
+                return self.pending[:count].copy()
+            return np.roll(self.pending, -(count % n), axis = 0)
+
+    @staticmethod
+    def quaternion_to_euler(q):
+        """
+        Converts an N x 4 array of (x, y, z, w) quaternions to arrays of yaw, pitch and roll.
+        Quaternions of zero norm give zero angles.
+        """
+        norm = np.sqrt((q ** 2).sum(axis = 1))
+        valid = norm != 0.
+        a, b, c, d = (q[valid] / norm[valid, np.newaxis]).T
+
+        yaw = np.zeros(q.shape[0])
+        pitch = np.zeros(q.shape[0])
+        roll = np.zeros(q.shape[0])
+        yaw[valid] = np.arctan2(2*a*b+2*c*d, 1-2*b*b-2*c*c)
+        pitch[valid] = np.arcsin(np.clip(2*(a*c-b*d), -1., 1.))
+        roll[valid] = np.arctan2(2*a*d+2*b*c, 1-2*c*c-2*d*d)+math.pi
+        roll[roll > math.pi] -= 2*math.pi
+        return yaw, pitch, roll
+
+    def flush_pending(self):
+        pending = self.take_pending()
+        if pending.shape[0] == 0:
+            return
+
+        yaw, pitch, roll = self.quaternion_to_euler(pending[:, 0:4])
+
+        self.yaw_scope_plotter.update_many(yaw)
+        self.pitch_scope_plotter.update_many(pitch)
+        self.roll_scope_plotter.update_many(roll)
+        self.avx_scope_plotter.update_many(pending[:, 4])
+        self.avy_scope_plotter.update_many(pending[:, 5])
+        self.avz_scope_plotter.update_many(pending[:, 6])
+        self.lax_scope_plotter.update_many(pending[:, 7])
+        self.lay_scope_plotter.update_many(pending[:, 8])
+        self.laz_scope_plotter.update_many(pending[:, 9])
 
     def draw(self):
-        t = time.time()
-
-        # capture changes in terminal shape at least every 0.5s
-        if t - self.last_update_shape_time > 0.25:
-            self.g.update_shape()
-            self.last_update_shape_time = t
-
+        self.flush_pending()
         self.g.clear()
         self.g.set_color(termgraphics.COLOR_WHITE)
         self.yaw_scope_plotter.plot()
@@ -10,8 +10,8 @@ class LaserScanViewer(Space2DViewer):
             """
             Calculates (x,y) coordinates from a LaserScan message and returns them as a Nx2 numpy array.
             """
-            angles = np.linspace(self.msg.angle_min, self.msg.angle_max, len(self.msg.ranges), dtype = np.float32)
-            ranges = np.array(self.msg.ranges, dtype = np.float32)
+            angles = np.linspace(msg.angle_min, msg.angle_max, len(msg.ranges), dtype = np.float32)
+            ranges = np.array(msg.ranges, dtype = np.float32)
             x_values = ranges * np.cos(angles)
             y_values = ranges * np.sin(angles)
 
@@ -1,11 +1,8 @@
 #!/usr/bin/env python3
 
-import functools
-from io import BytesIO, StringIO
 import math
 import numpy as np
 import requests
-import time
 import rosshow.termgraphics as termgraphics
 
 # <rant>
@@ -22,18 +19,6 @@ urllib3_cn.allowed_gai_family = allowed_gai_family
 
 # </rant>
 
-def memoize(f):
-    """ Memoization decorator for functions taking one or more arguments. """
-    class memodict(dict):
-        def __init__(self, f):
-            self.f = f
-        def __call__(self, *args):
-            return self[args]
-        def __missing__(self, key):
-            ret = self[key] = self.f(*key)
-            return ret
-    return memodict(f)
-
 try:
     from PIL import Image, ImageOps
 except ImportError:
@@ -42,23 +27,7 @@ except ImportError:
     print("and try again.")
     exit()
 
-@memoize
-def get_tile(xtile, ytile, zoom):
-    try:
-        url = 'https://a.tile.openstreetmap.org/%s/%s/%s.png' % (zoom, xtile, ytile)
-        response = requests.get(url, headers = {
-            "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Http-Upgrade-Insecure-Requests": "1",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
-            "Dnt": "1",
-        })
-        img = Image.open(BytesIO(response.content))
-    except IOError:
-        return None
-    except requests.exceptions.ConnectionError:
-        return None
-    return img.convert('RGB')
+from rosshow.viewers.sensor_msgs.tile_loader import TileLoader, DEFAULT_TILE_URL
 
 def deg2num(lat_deg, lon_deg, zoom):
   lat_rad = math.radians(lat_deg)
@@ -75,7 +44,7 @@ def num2deg(xtile, ytile, zoom):
   return (lat_deg, lon_deg)
 
 class NavSatFixViewer(object):
-    def __init__(self, canvas, title = ""):
+    def __init__(self, canvas, title = "", tile_url = DEFAULT_TILE_URL):
         self.g = canvas
         self.title = title
         self.xmin = 0
@@ -85,7 +54,7 @@ class NavSatFixViewer(object):
         self.zoom = 17
         self.data = [ (0,0) ] * 128
         self.pointer = 0
-        self.last_update_shape_time = 0
+        self.tile_loader = TileLoader(tile_url)
 
     def keypress(self, c):
         if c == "+" or c == "=":
@@ -97,18 +66,14 @@ class NavSatFixViewer(object):
             if self.zoom < 5:
                 self.zoom = 5
 
+    def close(self):
+        self.tile_loader.close()
+
     def update(self, msg):
         self.pointer = (self.pointer + 1) % len(self.data)
         self.data[self.pointer] = (msg.latitude, msg.longitude)
 
     def draw(self):
-        t = time.time()
-
-        # capture changes in terminal shape at least every 0.25s
-        if t - self.last_update_shape_time > 0.25:
-            self.g.update_shape()
-            self.last_update_shape_time = t
-
         lat_point = self.data[self.pointer][0]
         lon_point = self.data[self.pointer][1]
         width = self.g.shape[0]
@@ -118,7 +83,12 @@ class NavSatFixViewer(object):
         lat_min, lon_min = num2deg(xtile, ytile, self.zoom)
         lat_max, lon_max = num2deg(xtile + 1, ytile + 1, self.zoom)
 
-        img = get_tile(xtile, ytile, self.zoom)
+        img = self.tile_loader.get(xtile, ytile, self.zoom)
+
+        # the tiles around this one and this spot one zoom level in and out, in case the
+        # robot crosses into them or the user zooms
+        self.tile_loader.prefetch([(xtile + i, ytile + j, self.zoom) for j in (-1, 0, 1) for i in (-1, 0, 1)] +
+            [deg2num(lat_point, lon_point, zoom) + (zoom,) for zoom in (self.zoom + 1, self.zoom - 1) if 5 <= zoom <= 19])
 
         self.g.clear()
 
@@ -126,7 +96,7 @@ class NavSatFixViewer(object):
         self.g.set_color(termgraphics.COLOR_BLUE)
         if img is not None:
             img = img.resize((width, height), Image.NEAREST)
-            img_data = np.fromstring(img.tobytes(), dtype = np.uint8).reshape((width, height, 3))
+            img_data = np.frombuffer(img.tobytes(), dtype = np.uint8).reshape((width, height, 3))
 
             # "night mode" version of the image: just flip all the bits
             img_data_night = (~img_data >> 1)
@@ -140,9 +110,12 @@ class NavSatFixViewer(object):
             # draw text in pure white, clearing blocks of background
             self.g.set_color((255, 255, 255))
             self.g.image(img_data_text, width, height, (0, 0), image_type = termgraphics.IMAGE_MONOCHROME, clear_block = True)
-        else:
+        elif self.tile_loader.failed(xtile, ytile, self.zoom):
             self.g.set_color((127, 127, 127))
             self.g.text("[Unable to retrieve map image; is this machine online?]", (0, 0))
+        else:
+            self.g.set_color((127, 127, 127))
+            self.g.text("[Loading map image...]", (0, 0))
 
         # trail of last few positions
         self.g.set_color(termgraphics.COLOR_YELLOW)
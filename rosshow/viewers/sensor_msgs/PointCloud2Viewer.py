@@ -1,16 +1,46 @@
 #!/usr/bin/env python3
 
+import math
 import time
 import numpy as np
-try:
-    import sensor_msgs.point_cloud2 as pcl2
-except ImportError:  # in ros2 sensor_msgs.point_cloud2 is not available
-    import rosshow.viewers.sensor_msgs.ros2_pointcloud2 as pcl2
+from rosshow.viewers.sensor_msgs.numpy_pointcloud2 import read_xyz
 
 import rosshow.termgraphics as termgraphics
+from rosshow.viewers.generic.DecodeCache import DecodeCache
+
+class _Message(object):
+    """
+    Stands in for a message in a DecodePool worker: a bag of attributes.
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def cloud_payload(msg):
+    """
+    Splits a sensor_msgs/PointCloud2 into the (meta, data) a DecodePool worker decodes it from.
+    """
+    meta = {
+        "height": msg.height,
+        "width": msg.width,
+        "point_step": msg.point_step,
+        "row_step": msg.row_step,
+        "is_bigendian": msg.is_bigendian,
+        "fields": [{"name": f.name, "offset": f.offset, "datatype": f.datatype, "count": f.count} for f in msg.fields],
+    }
+    return meta, msg.data
+
+def decode_cloud(meta, data):
+    """
+    Reads the N x 3 array of points from the bytes of a sensor_msgs/PointCloud2, in a
+    DecodePool worker.
+    """
+    cloud = _Message(**meta)
+    cloud.fields = [_Message(**field) for field in meta["fields"]]
+    cloud.data = data
+    return read_xyz(cloud, skip_nans = True)
 
 class PointCloud2Viewer(object):
-    def __init__(self, canvas, title = ""):
+    def __init__(self, canvas, title = "", decode_pool = None):
         self.g = canvas
         self.scale = 500.0
         self.spin = 0.0
@@ -23,9 +53,16 @@ class PointCloud2Viewer(object):
         self.target_time = 0
         self.calculate_rotation()
         self.msg = None
-        self.last_update_shape_time = 0
+        self.decode_cache = DecodeCache(self.decode)
+        if decode_pool is not None:
+            self.decode_cache = decode_pool.cache(decode_cloud, cloud_payload)
+        self.decimate_cache = DecodeCache(self.decimate)
         self.title = title
 
+        # up to 2 ** detail points are drawn per braille dot at the default zoom
+        self.detail = 1
+        self.decimation = 1
+
     def keypress(self, c):
         if c == "+" or c == "=":
             self.target_camera_distance /= 1.5
@@ -43,6 +80,10 @@ class PointCloud2Viewer(object):
             self.target_tilt -= 0.1
         elif c == "up":
             self.target_tilt += 0.1
+        elif c == "d":
+            self.detail = max(self.detail - 1, -8)
+        elif c == "D":
+            self.detail = min(self.detail + 1, 8)
 
         self.target_time = time.time()
 
@@ -64,17 +105,43 @@ class PointCloud2Viewer(object):
     def update(self, msg):
         self.msg = msg
 
+    def decode(self, msg):
+        """
+        Reads the N x 3 array of points from msg.
+        """
+        return read_xyz(msg, skip_nans = True)
+
+    def decimate(self, points, ratio):
+        """
+        Returns about 1 in ratio of the N x 3 array of points: one picked at random from each run of
+        ratio consecutive points. Unlike a plain stride this doesn't line up with the scan
+        pattern of a lidar, and unlike a random sample of the whole cloud it keeps every part
+        of the scan covered.
+        """
+        if ratio == 1:
+            return points
+        n = points.shape[0]
+        indices = np.arange(0, n, ratio) + np.random.randint(0, ratio, (n + ratio - 1) // ratio)
+        return points[indices[indices < n]]
+
+    def decimation_ratio(self, n):
+        """
+        Returns the power of 2 to divide the number of points n by, so that about 2 ** detail
+        points are drawn per braille dot. Zooming in moves most of the cloud off the screen,
+        so more points are kept to keep the ones on the screen as dense.
+        """
+        dots = self.g.shape[0] * self.g.shape[1]
+        zoom = max(1.0, (self.scale / 500.0) * (50.0 / self.camera_distance))
+        budget = dots * 2.0 ** self.detail * zoom ** 2
+        if n <= budget:
+            return 1
+        return 2 ** int(math.ceil(math.log(n / budget, 2)))
+
     def draw(self):
-        if not self.msg:
+        msg = self.msg
+        if not msg:
             return
 
-        t = time.time()
-
-        # capture changes in terminal shape at least every 0.25s
-        if t - self.last_update_shape_time > 0.25:
-            self.g.update_shape()
-            self.last_update_shape_time = t
-
         # animation over 0.5s when zooming in/out
         if self.scale != self.target_scale or self.tilt != self.target_tilt or self.spin != self.target_spin or self.camera_distance != self.target_camera_distance:
             animation_fraction = (time.time() - self.target_time) / 1.0
@@ -90,8 +157,49 @@ class PointCloud2Viewer(object):
                 self.camera_distance = (1 - animation_fraction) * self.camera_distance + animation_fraction * self.target_camera_distance
             self.calculate_rotation()
 
-        points = np.array(list(pcl2.read_points(self.msg, skip_nans = True, field_names = ("x", "y", "z"))), dtype = np.float16)
+        # only decodes when a new message has arrived; moving the camera just redoes the projection
+        with self.g.profiler.stage("decode"):
+            points = self.decode_cache.get(msg)
+        if points is None: # the decode pool hasn't finished the first message yet
+            return
         self.g.clear()
+
+        # no more points than the screen can show; the ratio is quantized to powers of 2 so
+        # that the sample only changes with a new message or a big change of zoom or detail
+        n = points.shape[0]
+        self.decimation = self.decimation_ratio(n)
+        with self.g.profiler.stage("decimate"):
+            points = self.decimate_cache.get(points, self.decimation)
+
+        with self.g.profiler.stage("project"):
+            points, colors = self.project(points)
+
+        # display it
+        self.g.set_color((255, 255, 255))
+        with self.g.profiler.stage("raster"):
+            self.g.points(points, colors = colors)
+
+        self.g.set_color((0, 127, 255))
+        self.g.text(self.title, (0, self.g.shape[1] - 4))
+
+        self.g.set_color((127, 127, 127))
+        help_text = "up/down: tilt   left/right: rotate   +/-: zoom   d/D: detail"
+        self.g.text(help_text, (int(self.g.shape[0]/3), self.g.shape[1] - 4))
+
+        if self.decimation > 1:
+            decimation_text = "1/%d of %d points" % (self.decimation, n)
+        else:
+            decimation_text = "all %d points" % n
+        # on the line above the help text, which leaves no room after it on most terminals
+        self.g.text(decimation_text, (int(self.g.shape[0]/3), self.g.shape[1] - 8))
+
+        self.g.draw()
+
+    def project(self, points):
+        """
+        Projects the N x 3 array of points to the screen. Returns the screen coordinates and
+        colors of the points that are visible.
+        """
         w = self.g.shape[0]
         h = self.g.shape[1]
         xmax = self.scale
@@ -123,16 +231,4 @@ class PointCloud2Viewer(object):
         screen_js = screen_js[where_valid]
         screen_c = screen_c[where_valid, :]
 
-        # display it
-        self.g.set_color((255, 255, 255))
-        points = np.vstack((screen_is, screen_js)).T
-        self.g.points(points, colors = screen_c)
-
-        self.g.set_color((0, 127, 255))
-        self.g.text(self.title, (0, self.g.shape[1] - 4))
-
-        self.g.set_color((127, 127, 127))
-        self.g.text("up/down: tilt   left/right: rotate   +/-: zoom", (int(self.g.shape[0]/3), self.g.shape[1] - 4))
-
-        self.g.draw()
-
+        return np.vstack((screen_is, screen_js)).T, screen_c
@@ -0,0 +1,72 @@
+import numpy as np
+
+# PointField datatypes (sensor_msgs/PointField constants) to numpy types
+DATATYPES = {
+    1: "i1", # INT8
+    2: "u1", # UINT8
+    3: "i2", # INT16
+    4: "u2", # UINT16
+    5: "i4", # INT32
+    6: "u4", # UINT32
+    7: "f4", # FLOAT32
+    8: "f8", # FLOAT64
+}
+
+def pointcloud2_dtype(cloud, field_names = None):
+    """
+    Returns a numpy structured dtype matching one point of a sensor_msgs/PointCloud2 message,
+    with the offsets, types and byte order given by its fields and point_step. Only the
+    fields in field_names are included if given; fields of unknown type are left out.
+    """
+    byte_order = ">" if cloud.is_bigendian else "<"
+    names = []
+    formats = []
+    offsets = []
+    for field in cloud.fields:
+        if field_names is not None and field.name not in field_names:
+            continue
+        if field.datatype not in DATATYPES:
+            continue
+        names.append(field.name)
+        count = getattr(field, "count", 1)
+        formats.append((byte_order + DATATYPES[field.datatype], (count,)) if count > 1 else byte_order + DATATYPES[field.datatype])
+        offsets.append(field.offset)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": cloud.point_step})
+
+def read_points_array(cloud, field_names = None):
+    """
+    Returns the points of a sensor_msgs/PointCloud2 message as a 1D numpy structured array.
+    Works on ROS 1 (bytes) and ROS 2 (array.array) messages. The array is a view on
+    cloud.data unless rows are padded (row_step larger than width * point_step), so it must
+    not outlive the message.
+    """
+    dtype = pointcloud2_dtype(cloud, field_names)
+    try:
+        data = np.frombuffer(cloud.data, dtype = np.uint8)
+    except (TypeError, ValueError):
+        data = np.asarray(cloud.data, dtype = np.uint8)
+
+    n = cloud.width * cloud.height
+    if n == 0:
+        return np.empty(0, dtype = dtype)
+    if cloud.height <= 1 or cloud.row_step == cloud.width * cloud.point_step:
+        return np.ndarray(shape = (n,), dtype = dtype, buffer = data, strides = (cloud.point_step,))
+    points = np.ndarray(shape = (cloud.height, cloud.width), dtype = dtype, buffer = data,
+        strides = (cloud.row_step, cloud.point_step))
+    return points.reshape(-1)
+
+def read_xyz(cloud, skip_nans = True, dtype = np.float32):
+    """
+    Returns the x, y, z coordinates of the points of a sensor_msgs/PointCloud2 message as an
+    N x 3 array, without the points that have a NaN coordinate if skip_nans is True.
+    """
+    points = read_points_array(cloud, field_names = ("x", "y", "z"))
+    xyz = np.empty((points.shape[0], 3), dtype = dtype)
+    xyz[:, 0] = points["x"]
+    xyz[:, 1] = points["y"]
+    xyz[:, 2] = points["z"]
+    if skip_nans:
+        where_valid = ~np.isnan(xyz).any(axis = 1)
+        if not where_valid.all():
+            xyz = xyz[where_valid]
+    return xyz
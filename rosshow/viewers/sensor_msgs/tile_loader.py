@@ -0,0 +1,134 @@
+import collections
+import concurrent.futures
+import threading
+import time
+from io import BytesIO
+
+import requests
+from PIL import Image
+
+DEFAULT_TILE_URL = "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png"
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Http-Upgrade-Insecure-Requests": "1",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9",
+    "Dnt": "1",
+}
+
+def tile_url(url, xtile, ytile, zoom):
+    """
+    Returns the url of a tile from the template url, which has {x}, {y} and {z} in it.
+    Raises ValueError if url has other placeholders or isn't a valid template.
+    """
+    try:
+        return url.format(x = xtile, y = ytile, z = zoom)
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError("Invalid tile URL " + url + " (" + repr(e) + "); use {x}, {y} and {z} for the tile coordinates and zoom level")
+
+class TileLoader(object):
+    """
+    Fetches map tiles in the background, so that drawing never waits for the network.
+
+    Tiles are downloaded by a small pool of threads over one keep-alive requests.Session,
+    decoded to RGB PIL images and kept in an LRU cache of at most cache_size tiles. get()
+    returns a tile if it is cached and otherwise asks for it and returns None; prefetch()
+    asks for tiles that are likely to be needed soon. A tile that fails to download is
+    retried after retry_interval seconds.
+
+    url is a template with {x}, {y} and {z} (the zoom level), e.g. DEFAULT_TILE_URL or
+    http://localhost:8080/{z}/{x}/{y}.png for a local tile server.
+    """
+    def __init__(self, url = DEFAULT_TILE_URL, workers = 2, cache_size = 64, timeout = 5.0, retry_interval = 10.0):
+        self.url = url
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.cache_size = cache_size
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = requests.adapters.HTTPAdapter(pool_connections = 1, pool_maxsize = workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = workers)
+
+        # (x, y, zoom) -> tile image, most recently used last
+        self.cache = collections.OrderedDict()
+        # (x, y, zoom) -> time of the last failed download
+        self.failures = {}
+        # tiles queued or being downloaded
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def get(self, xtile, ytile, zoom):
+        """
+        Returns the tile as an RGB PIL image, or None if it isn't loaded (yet).
+        """
+        key = (xtile, ytile, zoom)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        self.request(key)
+        return None
+
+    def failed(self, xtile, ytile, zoom):
+        """
+        Returns whether the last download of the tile failed.
+        """
+        return (xtile, ytile, zoom) in self.failures
+
+    def prefetch(self, keys):
+        """
+        Asks for the (x, y, zoom) tiles in keys that aren't cached, in order.
+        """
+        for key in keys:
+            with self.lock:
+                cached = key in self.cache
+            if not cached:
+                self.request(key)
+
+    def request(self, key):
+        with self.lock:
+            if key in self.pending:
+                return
+            if key in self.failures and time.time() - self.failures[key] < self.retry_interval:
+                return
+            self.pending.add(key)
+        self.executor.submit(self.load, key)
+
+    def load(self, key):
+        """
+        Downloads and decodes a tile, in a worker thread.
+        """
+        if self.closed:
+            return
+        img = None
+        try:
+            response = self.session.get(tile_url(self.url, *key), timeout = self.timeout)
+            response.raise_for_status()
+            img = Image.open(BytesIO(response.content)).convert("RGB")
+        except Exception:
+            # network errors, bad images (including PIL's DecompressionBombError) and a bad
+            # url template all count as a failed download, which is retried later
+            pass
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+                if img is None:
+                    self.failures[key] = time.time()
+                else:
+                    self.failures.pop(key, None)
+                    self.cache[key] = img
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last = False)
+
+    def close(self):
+        """
+        Drops the tiles still queued, so that exiting only waits for the downloads in progress.
+        """
+        self.closed = True
+        self.executor.shutdown(wait = False)
+        self.session.close()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Smoke test of --workers: runs the real nodes/rosshow script on a pseudo terminal against a
+# stand-in rospy that publishes one sensor_msgs/CompressedImage topic, and checks that the
+# node starts once, no matter how many decode workers it spawns.
+#
+# Usage: python3 -m pytest test/test_workers.py
+
+import fcntl
+import io
+import os
+import pty
+import select
+import struct
+import subprocess
+import sys
+import termios
+import time
+
+import pytest
+import PIL.Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_ROSPY = '''
+import os, threading, time
+
+class exceptions(object):
+    class ROSInterruptException(Exception):
+        pass
+
+start_time = None
+
+def init_node(name, anonymous = False):
+    global start_time
+    start_time = time.time()
+    with open(os.environ["ROSSHOW_TEST_LOG"], "a") as f:
+        f.write("init_node %d\\n" % os.getpid())
+
+def get_published_topics():
+    return [("/camera/image/compressed", "sensor_msgs/CompressedImage")]
+
+def is_shutdown():
+    return time.time() - start_time > float(os.environ["ROSSHOW_TEST_DURATION"])
+
+def signal_shutdown(reason):
+    pass
+
+class Subscriber(object):
+    def __init__(self, topic, message_class, callback, **kwargs):
+        def publish():
+            while not is_shutdown():
+                callback(message_class())
+                time.sleep(0.05)
+        thread = threading.Thread(target = publish)
+        thread.daemon = True
+        thread.start()
+'''
+
+FAKE_SENSOR_MSGS = '''
+import os
+
+class CompressedImage(object):
+    def __init__(self):
+        self.format = "jpeg"
+        with open(os.environ["ROSSHOW_TEST_JPEG"], "rb") as f:
+            self.data = f.read()
+'''
+
+def make_fake_ros(path):
+    with open(os.path.join(path, "rospy.py"), "w") as f:
+        f.write(FAKE_ROSPY)
+    os.makedirs(os.path.join(path, "sensor_msgs"))
+    with open(os.path.join(path, "sensor_msgs", "__init__.py"), "w") as f:
+        f.write("")
+    with open(os.path.join(path, "sensor_msgs", "msg.py"), "w") as f:
+        f.write(FAKE_SENSOR_MSGS)
+    output = io.BytesIO()
+    PIL.Image.new("RGB", (640, 480), (255, 127, 0)).save(output, format = "JPEG")
+    with open(os.path.join(path, "image.jpg"), "wb") as f:
+        f.write(output.getvalue())
+
+def run_node(path, args, duration = 3.0, timeout = 60.0):
+    """
+    Runs nodes/rosshow with args on a pseudo terminal and returns its exit code and output.
+    """
+    env = dict(os.environ,
+        PYTHONPATH = os.pathsep.join([path, ROOT]),
+        ROSSHOW_TEST_LOG = os.path.join(path, "log"),
+        ROSSHOW_TEST_JPEG = os.path.join(path, "image.jpg"),
+        ROSSHOW_TEST_DURATION = str(duration),
+        TERM = "xterm-256color")
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack("HHHH", 24, 80, 0, 0))
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "nodes", "rosshow")] + args,
+        stdin = slave, stdout = slave, stderr = slave, env = env, close_fds = True)
+    os.close(slave)
+
+    output = b""
+    deadline = time.time() + timeout
+    while process.poll() is None and time.time() < deadline:
+        if select.select([master], [], [], 0.1)[0]:
+            try:
+                output += os.read(master, 65536)
+            except OSError:
+                break
+    if process.poll() is None:
+        process.kill()
+    returncode = process.wait()
+
+    # and whatever its children, e.g. the resource tracker, wrote as it exited
+    while select.select([master], [], [], 0.5)[0]:
+        try:
+            data = os.read(master, 65536)
+        except OSError:
+            break
+        if not data:
+            break
+        output += data
+    os.close(master)
+    return returncode, output
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason = "decode workers need python 3.8")
+def test_workers_start_node_once(tmp_path):
+    path = str(tmp_path)
+    make_fake_ros(path)
+    returncode, output = run_node(path, ["--workers", "2", "/camera/image/compressed"])
+    assert returncode == 0, output[-2000:].decode(errors = "replace")
+
+    with open(os.path.join(path, "log")) as f:
+        starts = f.read().split()[1::2]
+    assert len(starts) == 1, "node started %d times: %s" % (len(starts), starts)
+
+    # shared memory blocks of decodes in flight at exit are cleaned up too
+    assert b"leaked" not in output, output[-2000:].decode(errors = "replace")